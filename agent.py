@@ -0,0 +1,43 @@
+"""
+LangChain side of the LLM stack: the chat model and ReAct agent behind the chat.
+
+LangChain, LangGraph and langchain-openai take seconds to import, so llm.py
+only imports this module once a chat prompt needs the agent.
+"""
+import asyncio
+from typing import Any, List
+from langchain_core.rate_limiters import BaseRateLimiter
+from langchain_openai import ChatOpenAI
+from langgraph.prebuilt import create_react_agent
+from llm import RateLimitScheduler, AGENT_MODEL, LLM_AGENT_REQUEST_TOKENS, LLM_RATE_LIMIT_RETRIES
+
+
+class SchedulerRateLimiter(BaseRateLimiter):
+    """Lets a LangChain chat model wait in the same queue as the other OpenAI calls to its key and model."""
+
+    def __init__(self, scheduler: RateLimitScheduler, tokens: int = LLM_AGENT_REQUEST_TOKENS):
+        self.scheduler = scheduler
+        self.tokens = tokens
+
+    def acquire(self, *, blocking: bool = True) -> bool:
+        return self.scheduler.acquire(self.tokens, blocking)
+
+    async def aacquire(self, *, blocking: bool = True) -> bool:
+        if not blocking:
+            return self.scheduler.acquire(self.tokens, blocking=False)
+        return await asyncio.to_thread(self.scheduler.acquire, self.tokens)
+
+
+def build_chat_model(api_key: str, scheduler: RateLimitScheduler) -> ChatOpenAI:
+    # The chat model's own client retries its 429s, honouring the server's Retry-After
+    return ChatOpenAI(
+        model=AGENT_MODEL,
+        api_key=api_key,
+        stream_usage=True,
+        rate_limiter=SchedulerRateLimiter(scheduler),
+        max_retries=LLM_RATE_LIMIT_RETRIES
+    )
+
+
+def build_agent(chat_model: ChatOpenAI, tools: List[Any]):
+    return create_react_agent(chat_model, tools)
@@ -0,0 +1,274 @@
+import os
+import json
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List
+from llm import estimate_tokens, chat_completion, CHARS_PER_TOKEN
+from cache import TTLCache, SingleFlight
+from telemetry import in_current_context
+from governance_stats import compact_proposal, format_stats_table, get_governance_stats
+
+ANALYSIS_MODEL = "gpt-4o-mini"
+
+# Proposal tokens up to which the whole history is analyzed in a single prompt
+ANALYSIS_SINGLE_PASS_TOKENS = int(os.environ.get("ANALYSIS_SINGLE_PASS_TOKENS", 20000))
+# Proposal tokens per map batch when the history is too large for a single prompt
+ANALYSIS_BATCH_TOKENS = int(os.environ.get("ANALYSIS_BATCH_TOKENS", 12000))
+# Map batches analyzed at the same time
+ANALYSIS_CONCURRENCY = int(os.environ.get("ANALYSIS_CONCURRENCY", 4))
+
+# Finished analyses shared across sessions: how many, for how long, and optionally where on disk
+ANALYSIS_CACHE_SIZE = int(os.environ.get("ANALYSIS_CACHE_SIZE", 256))
+ANALYSIS_CACHE_TTL = int(os.environ.get("ANALYSIS_CACHE_TTL", 24 * 60 * 60))
+ANALYSIS_CACHE_DIR = os.environ.get("ANALYSIS_CACHE_DIR")
+
+SYSTEM_PROMPT = "You are an expert in DAO (decentralized autonomous organization) governance proposals."
+
+SPACE_COMPONENTS = """
+            Key components in DAO Info:
+            'id': Snapshot space ID for the DAO
+            'name': The display name of the DAO
+            'about': Contains voting information for the DAO
+            'avatar': A link to the DAO's logo/avatar image
+            'network': A number given by Snapshot representing which blockchain network the DAO is in
+            'symbol': The governance token symbol
+            'strategies': Defines how voting power is calculated containing 'name' which is the name of the strategy and 'params' which are the parameters including 'symbol' which is the governance token symbol, 'address' which is the token address and 'decimals' which is the number of decimal places the token can be divided into
+            'admins': Contains the admin crypto wallet address
+            'moderators': Contains who the moderators are
+            'members': Contains who the members are
+            'filters': Contains voting rules including 'minScore' which is the minimum voting power required and 'onlyMembers' which determines if voting is or is not restricted to members only
+            'plugins': Contains configuration of additional plugins
+            'admins_count', 'moderators_count', 'members_count': Number of admins, moderators and members, given instead of the lists in pruned data
+"""
+
+PROPOSAL_COMPONENTS = """
+            Key components in Historical Proposals:
+            'id': Unique identifier for the proposal
+            'title': Title of the proposal
+            'body': Full proposal text/content
+            'choices': Array of voting options/choices
+            'state': Current state of the proposal if it is still active or closed
+            'author': Cryto wallet address of the proposal creator
+            'created': Unix format timestamp when proposal was created
+            'outcome': 'passed' or 'failed' when a for or against choice won, 'other' for other choices, 'no votes' or 'open'
+            'winning_choice': The choice with the most votes
+            'winning_share': Share of the votes cast that went to the winning choice
+            'votes': Total votes cast
+            'duration_days': Length of the voting period in days
+            'body_length': Length in characters of the full proposal text, given when 'body' was shortened or left out
+"""
+
+ANALYSIS_POINTS = """
+            1. Analyze DAO goals and community preferences
+            2. Study successful vs failed proposals
+            3. Analyze successful proposal titles and patterns
+            4. Identify optimal proposal structure and language (eg. average proposal length, common sections used etc) of successful proposals
+            5. Check for potential contradictions with other proposals
+            6. Assess security risks and governance attack vectors
+            7. Evaluate potential governance mistakes to avoid
+            8. Consider harmonious proposal combinations
+            9. Evaluate optimal voting duration of successful proposals
+"""
+
+
+def _complete(api_key: str, prompt: str) -> str:
+    response = chat_completion(
+        api_key,
+        model=ANALYSIS_MODEL,
+        messages=[
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": prompt}
+        ]
+    )
+    return response.choices[0].message.content
+
+
+def batch_proposals(proposals: List[Dict[str, Any]], max_tokens: int) -> List[List[Dict[str, Any]]]:
+    """
+    Split proposals, in order, into batches of at most `max_tokens` estimated
+    tokens. A single proposal larger than the budget gets its body truncated.
+    """
+    batches = []
+    batch = []
+    batch_tokens = 0
+
+    for proposal in proposals:
+        tokens = estimate_tokens(proposal)
+        if tokens > max_tokens:
+            overflow_chars = (tokens - max_tokens) * CHARS_PER_TOKEN + 100
+            proposal = dict(proposal)
+            proposal["body"] = (proposal.get("body") or "")[:-overflow_chars] + " [truncated]"
+            tokens = estimate_tokens(proposal)
+
+        if batch and batch_tokens + tokens > max_tokens:
+            batches.append(batch)
+            batch = []
+            batch_tokens = 0
+
+        batch.append(proposal)
+        batch_tokens += tokens
+
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+def group_analyses(analyses: List[str], max_tokens: int) -> List[List[str]]:
+    """Group partial analyses into merges of at most `max_tokens`, at least two per group."""
+    groups = []
+    group = []
+    group_tokens = 0
+
+    for analysis in analyses:
+        tokens = estimate_tokens(analysis)
+        if len(group) >= 2 and group_tokens + tokens > max_tokens:
+            groups.append(group)
+            group = []
+            group_tokens = 0
+
+        group.append(analysis)
+        group_tokens += tokens
+
+    if group:
+        groups.append(group)
+    return groups
+
+
+def single_pass_prompt(space_info: str, proposals_info: str, stats_info: str) -> str:
+    return f"""
+            As a DAO governance proposal expert, analyze this DAO data obtained from the DAO governance platform Snapshot.
+            
+            DAO Info:
+            {space_info}
+{SPACE_COMPONENTS}
+            Historical Proposals:
+            {proposals_info}
+{PROPOSAL_COMPONENTS}
+            Governance Statistics (exact figures for these proposals; use them rather than recomputing them):
+{stats_info}
+
+            Based on this data, do a comprehensive analysis for each of the following points:
+{ANALYSIS_POINTS}
+            Output:
+            The comprehensive analysis done above of the DAO data. DO NOT mention examples of any protocols or projects in the output analysis.
+            """
+
+
+def map_prompt(space_info: str, proposals_info: str, batch_number: int, batch_count: int) -> str:
+    return f"""
+            As a DAO governance proposal expert, analyze one batch ({batch_number} of {batch_count}) of this DAO's historical proposals obtained from the DAO governance platform Snapshot. The findings will later be merged with the findings from the other batches.
+            
+            DAO Info:
+            {space_info}
+{SPACE_COMPONENTS}
+            Historical Proposals (this batch only):
+            {proposals_info}
+{PROPOSAL_COMPONENTS}
+            For this batch, report concise findings for each of the following points:
+{ANALYSIS_POINTS}
+            Output:
+            Findings for each point in compact bullet points. Include the recurring titles, sections, authors and topics of this batch; overall figures such as pass rates, proposal lengths and voting durations are computed separately. DO NOT mention examples of any protocols or projects in the output.
+            """
+
+
+def combine_prompt(space_info: str, partial_analyses: List[str], final: bool, stats_info: str = "") -> str:
+    partials = "\n\n".join(
+        f"Partial analysis {number}:\n{partial}" for number, partial in enumerate(partial_analyses, start=1)
+    )
+    if final:
+        output = "The comprehensive analysis done above of the DAO data. DO NOT mention examples of any protocols or projects in the output analysis."
+        task = "do a comprehensive analysis for each of the following points"
+        partials += (
+            "\n\nGovernance Statistics (exact figures for all the proposals; use them rather than recomputing them):\n"
+            f"{stats_info}"
+        )
+    else:
+        output = "Merged findings for each point in compact bullet points, keeping exact combined figures. DO NOT mention examples of any protocols or projects in the output."
+        task = "merge the findings for each of the following points, adding up figures where they can be combined"
+
+    return f"""
+            As a DAO governance proposal expert, the historical proposals of this DAO obtained from the DAO governance platform Snapshot were analyzed in batches. Combine the partial analyses below into one.
+            
+            DAO Info:
+            {space_info}
+{SPACE_COMPONENTS}
+            {partials}
+
+            Based on these partial analyses, {task}:
+{ANALYSIS_POINTS}
+            Output:
+            {output}
+            """
+
+
+def build_dao_analysis(dao_data: Dict[str, Any], api_key: str) -> str:
+    """
+    Run the nine-point DAO analysis over `dao_data`.
+
+    Small proposal histories are analyzed in a single prompt. Larger ones are
+    split into token-budgeted batches that are analyzed concurrently (map) and
+    the partial analyses are then merged, in several rounds if needed, into
+    the final analysis (reduce), so the number of proposals is limited by
+    throughput rather than by the model's context or tokens-per-minute limit.
+    """
+    space_info = json.dumps(dao_data["space"])
+    # Outcomes, turnout and durations are computed locally instead of left to the model
+    proposals = [compact_proposal(proposal) for proposal in dao_data["proposals"]]
+    proposals_info = json.dumps(proposals)
+    stats_info = format_stats_table(get_governance_stats(dao_data))
+
+    if estimate_tokens(proposals_info) <= ANALYSIS_SINGLE_PASS_TOKENS:
+        return _complete(api_key, single_pass_prompt(space_info, proposals_info, stats_info))
+
+    batches = batch_proposals(proposals, ANALYSIS_BATCH_TOKENS)
+    with ThreadPoolExecutor(max_workers=ANALYSIS_CONCURRENCY) as executor:
+        partial_analyses = list(executor.map(
+            in_current_context(lambda numbered: _complete(
+                api_key, map_prompt(space_info, json.dumps(numbered[1]), numbered[0], len(batches))
+            )),
+            enumerate(batches, start=1)
+        ))
+
+        # Merge partial analyses in groups until they fit in one final prompt
+        while len(partial_analyses) > 1 and estimate_tokens("".join(partial_analyses)) > ANALYSIS_BATCH_TOKENS:
+            groups = group_analyses(partial_analyses, ANALYSIS_BATCH_TOKENS)
+            partial_analyses = list(executor.map(
+                in_current_context(lambda group: group[0] if len(group) == 1 else _complete(
+                    api_key, combine_prompt(space_info, group, final=False)
+                )),
+                groups
+            ))
+
+    return _complete(api_key, combine_prompt(space_info, partial_analyses, final=True, stats_info=stats_info))
+
+
+def analysis_cache_key(dao_data: Dict[str, Any]) -> str:
+    """Key an analysis by space id, data profile and a hash of the analyzed proposals' ids and states."""
+    proposal_states = sorted((proposal["id"], proposal.get("state")) for proposal in dao_data["proposals"])
+    digest = hashlib.sha256(json.dumps(proposal_states).encode("utf-8")).hexdigest()
+    return f"{dao_data['space']['id']}:{dao_data.get('profile', 'full')}:{digest}"
+
+
+def get_dao_analysis(dao_data: Dict[str, Any], api_key: str) -> str:
+    """
+    Return the cached analysis for this space and proposal set, building it on
+    a miss. Concurrent misses for the same key share one build.
+    """
+    cache_key = analysis_cache_key(dao_data)
+    analysis = analysis_cache.get(cache_key)
+    if analysis is None:
+        analysis = analysis_flights.do(cache_key, lambda: _build_and_cache(cache_key, dao_data, api_key))
+    return analysis
+
+
+def _build_and_cache(cache_key: str, dao_data: Dict[str, Any], api_key: str) -> str:
+    # A build that finished just before this one started has already cached the analysis
+    analysis = analysis_cache.get(cache_key)
+    if analysis is None:
+        analysis = build_dao_analysis(dao_data, api_key)
+        analysis_cache.set(cache_key, analysis)
+    return analysis
+
+
+analysis_cache = TTLCache(max_entries=ANALYSIS_CACHE_SIZE, ttl=ANALYSIS_CACHE_TTL, path=ANALYSIS_CACHE_DIR)
+analysis_flights = SingleFlight()
@@ -1,20 +1,32 @@
+import time
+
+# Start of this script run; the imports and the first elements drawn are timed for the startup report
+script_started = time.perf_counter()
+
 import streamlit as st
-from openai import OpenAI
 from dotenv import load_dotenv
 import os
-import requests
-import difflib
-import re
+import uuid
 from typing import Dict, Any
-import json
-from langchain_core.messages import SystemMessage, HumanMessage, AIMessage
-from langchain_openai import ChatOpenAI
-from langgraph.prebuilt import create_react_agent
-from langchain_core.tools import tool, ToolException
 
 # Load environment variables from .env file
 load_dotenv()
 
+# Imported after load_dotenv so their settings can come from the .env file. Imported modules survive
+# script reruns, so the clients, caches and workers they create at module level are shared by every session
+from optimizer import format_optimizer_result
+from jobs import get_job_service, FINISHED_STATES
+from warmup import get_warmup_worker
+from llm import estimate_tokens, get_agent
+from telemetry import start_trace, span, record, startup_timings
+from language import english_fast_path
+from snapshot import proposal_flights
+from analysis import analysis_cache, analysis_flights
+from session_store import get_session_store, trim_resident, SESSION_RESIDENT_MESSAGES, SESSION_URL_RESTORE
+# LangChain and LangGraph are imported where a chat prompt first needs them, not here
+
+imports_done = time.perf_counter()
+
 # Custom CSS for dark theme and UI modifications
 st.markdown(
     """
@@ -256,8 +268,26 @@ st.markdown(
 )
 
 # Initialize session state for chat history and API key status
+if 'session_id' not in st.session_state:
+    if SESSION_URL_RESTORE:
+        # Anyone with the page's URL can read and extend this conversation
+        st.session_state.session_id = st.query_params.get("session") or uuid.uuid4().hex
+        st.query_params["session"] = st.session_state.session_id
+    else:
+        st.session_state.session_id = uuid.uuid4().hex
+        if "session" in st.query_params:
+            del st.query_params["session"]
 if 'messages' not in st.session_state:
-    st.session_state.messages = []
+    # Only the most recent messages are kept in memory; the rest are read from the session store when needed
+    stored_messages = get_session_store().recent(st.session_state.session_id, SESSION_RESIDENT_MESSAGES + 1)
+    st.session_state.messages = trim_resident(stored_messages)
+    st.session_state.history_complete = (
+        len(stored_messages) <= SESSION_RESIDENT_MESSAGES and len(st.session_state.messages) == len(stored_messages)
+    )
+    # An optimization that was still running when the session was last shown
+    pending_job = get_session_store().pending_job(st.session_state.session_id)
+    if pending_job:
+        st.session_state.optimizer_job = pending_job
 if 'api_key_active' not in st.session_state:
     st.session_state.api_key_active = False
 
@@ -276,7 +306,7 @@ def initialize_streamlit():
     st.write("If you have a DAO proposal you want to optimize, please provide me the following:")
     st.write("1. The name of the DAO you're submitting the proposal to.")
     st.write("2. The proposal you want to optimize (I support proposals in 50+ languages and returns the optimized proposal to you in English).")
-    st.write("3. The number of recent proposals to analyze for this DAO (If you are using our provided OpenAI API key, you can analyze up to 50 recent proposals. If you are using your OpenAI API key, if 50 proposals returns an error, then analyze up to 20 to 25 recent proposals. This is due to token rate limits set by OpenAI depending on which Tier level your OpenAI account is on).")
+    st.write("3. The number of recent proposals to analyze for this DAO (Large numbers of proposals, up to several hundred, are analyzed in batches, so they take longer but no longer run into OpenAI's token limits).")
 
     # Sidebar title and API Key Management
     st.sidebar.title("🤖 Deo AI")
@@ -307,6 +337,8 @@ def initialize_streamlit():
             unsafe_allow_html=True
         )
     
+    st.sidebar.checkbox("Show request telemetry", key="show_telemetry")
+    
     return user_api_key if user_api_key and st.session_state.api_key_active else default_key
 
 # This helper function escapes $ signs so they are not interpreted as LaTeX.
@@ -317,8 +349,43 @@ def sanitize_dollar_signs(text: str) -> str:
     """
     return text.replace("$", "&#36;")
 
-# Creating langgraph agent tool
-@tool
+# Number of most recent conversation turns (a user message and its reply) drawn on every rerun
+CHAT_HISTORY_TURNS = 10
+
+def display_text(message: Dict[str, Any]) -> str:
+    """Sanitized content of a chat message, computed once and kept on the message."""
+    if "display" not in message:
+        message["display"] = sanitize_dollar_signs(message["content"])
+    return message["display"]
+
+def add_message(message: Dict[str, Any]):
+    """
+    Append a message to the chat history in the session store and in memory,
+    where only the most recent messages and the latest hidden analysis are kept.
+    """
+    get_session_store().append(st.session_state.session_id, message)
+    resident = trim_resident(st.session_state.messages + [message])
+    st.session_state.history_complete = (
+        st.session_state.history_complete and len(resident) == len(st.session_state.messages) + 1
+    )
+    st.session_state.messages = resident
+
+def recent_chat_messages(messages, limit: int):
+    """
+    Return the last `limit` user and assistant messages, oldest first, and
+    whether earlier ones were left out. Scans from the end so the cost does
+    not grow with the length of the conversation.
+    """
+    recent = []
+    for position in range(len(messages) - 1, -1, -1):
+        if messages[position]["role"] not in ("user", "assistant"):
+            continue
+        if len(recent) == limit:
+            return recent[::-1], True
+        recent.append(messages[position])
+    return recent[::-1], False
+
+# Langgraph agent tool; wrapped with LangChain's @tool when a prompt first needs the agent
 def dao_proposal_optimizer(dao_name: str, initial_proposal: str, num_proposals: int = 25) -> str:
     """
     Optimizes a DAO proposal based on analysis of historical DAO data.
@@ -336,340 +403,38 @@ def dao_proposal_optimizer(dao_name: str, initial_proposal: str, num_proposals:
         ToolException: If DAO is not found or other errors occur
     """
 
-    # Internal function: Get Space ID by fuzzy matching DAO name
-    def get_space_id() -> str:
-        url = "https://hub.snapshot.org/graphql"
-        query = """
-        query($skip: Int!) {
-            spaces(
-                first: 1000,
-                skip: $skip,
-                where: {
-                    verified: true
-                }
-            ) {
-                id
-                name
-            }
-        }
-        """
-        
-        def clean_name(name: str) -> str:
-            name = name.lower()
-            name = re.sub(r'\b(dao|protocol|finance|v[0-9]+|governance)\b', '', name)
-            name = ' '.join(name.split())
-            return name
-        
-        def calculate_similarity(name1: str, name2: str, space_id: str) -> float:
-            if name1.lower() == space_id.lower():
-                return 1.0
-            
-            name1_clean = clean_name(name1)
-            name2_clean = clean_name(name2)
-            
-            if name1_clean == name2_clean:
-                return 1.0
-                
-            base_similarity = difflib.SequenceMatcher(None, name1_clean, name2_clean).ratio()
-            
-            if name1_clean in name2_clean or name2_clean in name1_clean:
-                return base_similarity + 0.3
-            
-            length_ratio = min(len(name1_clean), len(name2_clean)) / max(len(name1_clean), len(name2_clean))
-            if length_ratio < 0.5:
-                return base_similarity * 0.5
-                
-            words1 = set(name1_clean.split())
-            words2 = set(name2_clean.split())
-            if words1 and words2:
-                word_match_ratio = len(words1.intersection(words2)) / max(len(words1), len(words2))
-                if len(words1.intersection(words2)) == 0:
-                    return base_similarity * 0.3
-            else:
-                word_match_ratio = 0
-            
-            return min((base_similarity * 0.7) + (word_match_ratio * 0.3), 1.0)
-        
-        try:
-            skip = 0
-            all_spaces = []
-            
-            while True:
-                response = requests.post(
-                    url,
-                    json={
-                        "query": query,
-                        "variables": {"skip": skip}
-                    }
-                )
-                
-                if response.status_code != 200:
-                    raise ToolException(f"Snapshot API request failed: {response.text}")
-                    
-                data = response.json()
-                spaces = data.get("data", {}).get("spaces", [])
-                
-                if not spaces:
-                    break
-                    
-                all_spaces.extend(spaces)
-                skip += 1000
-            
-            if not all_spaces:
-                raise ToolException("No spaces found on Snapshot")
-            
-            matches = []
-            for space in all_spaces:
-                if not space.get('name') or not space.get('id'):
-                    continue
-                
-                similarity = calculate_similarity(dao_name, space['name'], space['id'])
-                matches.append((similarity, space['id'], space['name']))
-            
-            matches.sort(reverse=True)
-            
-            if matches and matches[0][0] > 0.6:
-                return matches[0][1]
-            else:
-                raise ToolException(f"DAO '{dao_name}' not found on Snapshot platform")
-                
-        except ToolException:
-            raise
-        except Exception as e:
-            raise ToolException(f"Error finding DAO space: {str(e)}")
-
-    # Internal function: Get DAO data from Snapshot
-    def get_dao_data(space_id: str) -> Dict[str, Any]:
-        if space_id.startswith("'") and space_id.endswith("'"):
-            space_id = space_id[1:-1]
-
-        API_URL = "https://hub.snapshot.org/graphql"
-        space_query = """
-        query GetSpaceData($space_id: String!, $num_proposals: Int!) {
-            space(id: $space_id) {
-                id
-                name
-                about
-                avatar
-                network
-                symbol
-                strategies {
-                    name
-                    params
-                }
-                admins
-                moderators
-                members
-                filters {
-                    minScore
-                    onlyMembers
-                }
-                plugins
-            }
-            proposals(
-                first: $num_proposals,
-                skip: 0,
-                where: {
-                    space: $space_id
-                },
-                orderBy: "created",
-                orderDirection: desc
-            ) {
-                id
-                title
-                body
-                choices
-                start
-                end
-                snapshot
-                state
-                author
-                created
-                scores
-                scores_total
-            }
-        }
-        """
-        
-        try:
-            response = requests.post(
-                API_URL,
-                json={
-                    "query": space_query,
-                    "variables": {
-                        "space_id": space_id,
-                        "num_proposals": num_proposals
-                    }
-                }
-            )
-            response.raise_for_status()
-            data = response.json()
-            
-            if "data" in data and data["data"]["space"] is None:
-                raise ToolException(f"DAO space '{space_id}' not found")
-                
-            if "errors" in data:
-                raise ToolException(f"Error fetching DAO data: {data['errors']}")
-                
-            return {
-                "space": data["data"]["space"],
-                "proposals": data["data"]["proposals"]
-            }
-            
-        except requests.exceptions.RequestException as e:
-            raise ToolException(f"API request failed: {str(e)}")
-        except Exception as e:
-            raise ToolException(f"Error fetching DAO data: {str(e)}")
-
-    # Internal function: Analyze DAO data from Snapshot
-    def analyze_dao_data(dao_data: Dict[str, Any]) -> str:
-        try:                
-            api_key = api_key_to_use
-            client = OpenAI(api_key=api_key)
-            
-            space_info = json.dumps(dao_data["space"])
-            proposals_info = json.dumps(dao_data["proposals"])
-            
-            analysis_prompt = f"""
-            As a DAO governance proposal expert, analyze this DAO data obtained from the DAO governance platform Snapshot.
-            
-            DAO Info:
-            {space_info}
-
-            Key components in DAO Info:
-            'id': Snapshot space ID for the DAO
-            'name': The display name of the DAO
-            'about': Contains voting information for the DAO
-            'avatar': A link to the DAO's logo/avatar image
-            'network': A number given by Snapshot representing which blockchain network the DAO is in
-            'symbol': The governance token symbol
-            'strategies': Defines how voting power is calculated containing 'name' which is the name of the strategy and 'params' which are the parameters including 'symbol' which is the governance token symbol, 'address' which is the token address and 'decimals' which is the number of decimal places the token can be divided into
-            'admins': Contains the admin crypto wallet address
-            'moderators': Contains who the moderators are
-            'members': Contains who the members are
-            'filters': Contains voting rules including 'minScore' which is the minimum voting power required and 'onlyMembers' which determines if voting is or is not restricted to members only
-            'plugins': Contains configuration of additional plugins
-
-            Historical Proposals:
-            {proposals_info}
-
-            Key components in Historical Proposals:
-            'id': Unique identifier for the proposal
-            'title': Title of the proposal
-            'body': Full proposal text/content
-            'choices': Array of voting options/choices
-            'start': Start Unix format timestamp for voting
-            'end': End Unix format timestamp for voting
-            'snapshot': Block number for the snapshot
-            'state': Current state of the proposal if it is still active or closed
-            'author': Cryto wallet address of the proposal creator
-            'created': Unix format timestamp when proposal was created
-            'scores': Array of vote counts for each corresponding options/choices in 'choices'
-            'scores_total': Total votes cast
-            
-            Based on this data, do a comprehensive analysis for each of the following points:
-            1. Analyze DAO goals and community preferences
-            2. Study successful vs failed proposals
-            3. Analyze successful proposal titles and patterns
-            4. Identify optimal proposal structure and language (eg. average proposal length, common sections used etc) of successful proposals
-            5. Check for potential contradictions with other proposals
-            6. Assess security risks and governance attack vectors
-            7. Evaluate potential governance mistakes to avoid
-            8. Consider harmonious proposal combinations
-            9. Evaluate optimal voting duration of successful proposals
-
-            Output:
-            The comprehensive analysis done above of the DAO data. DO NOT mention examples of any protocols or projects in the output analysis.
-            """
-            
-            analysis_response = client.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=[
-                    {"role": "system", "content": "You are an expert in DAO (decentralized autonomous organization) governance proposals."},
-                    {"role": "user", "content": analysis_prompt}
-                ]
-            )
-
-            return analysis_response.choices[0].message.content
-            
-        except Exception as e:
-            raise ToolException(f"Error analyzing DAO data: {str(e)}")
-
-    # Internal function: Optimize proposal
-    def optimize_proposal(english_proposal: str, dao_data_analysis: str) -> str:
-        try:
-            api_key = api_key_to_use
-            client = OpenAI(api_key=api_key)
-            
-            optimize_prompt = f"""
-            As a DAO governance proposal optimization expert, optimize the initial proposal below based on the DAO data analysis obtained from the DAO platform Snapshot to obtain a higher passing rate.
-
-            Initial Proposal:
-            {english_proposal}
-            
-            DAO Data Analysis:
-            {dao_data_analysis}
-
-            In addition, for the optimized proposal use clear, professional language that balances technical and non-technical understanding.
-
-            Output:
-            1. An optimized version of the initial proposal based on the DAO data analysis
-            2. A bullet-point list of all changes and recommendations made
-
-            Keep the output focused only on the optimized proposal and the list of changes/recommendations. Do not output anything else.
-            """
-            
-            optimization_response = client.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=[
-                    {"role": "system", "content": "You are an expert in DAO (decentralized autonomous organization) governance and proposal optimization."},
-                    {"role": "user", "content": optimize_prompt}
-                ]
-            )
-            
-            return optimization_response.choices[0].message.content
-            
-        except Exception as e:
-            raise ToolException(f"Error optimizing proposal: {str(e)}")
+    from langchain_core.tools import ToolException
+    from langgraph.config import get_stream_writer
 
+    # Streams the job id and the optimized proposal's tokens to the chat UI when run inside the agent graph
     try:
-        space_id = get_space_id()
-        dao_data = get_dao_data(space_id)
-        dao_analysis = analyze_dao_data(dao_data)
-        
-        api_key = api_key_to_use
-        client = OpenAI(api_key=api_key)
-        translation_prompt = f"""
-        Detect the language of this text and if it's not English, translate it to English. 
-        If this text is in English, then output the exact same text word for word:
-        {initial_proposal}
-        """
-        translation_response = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {"role": "system", "content": "You are a language detection and translation expert."},
-                {"role": "user", "content": translation_prompt}
-            ]
-        )
-        english_proposal = translation_response.choices[0].message.content
+        stream_writer = get_stream_writer()
+    except (RuntimeError, KeyError):
+        stream_writer = None
+
+    # The optimization runs as a job on the shared worker pool, so it survives reruns of this script
+    with span("dao_proposal_optimizer"):
+        job_service = get_job_service()
+        job_id = job_service.submit(dao_name, initial_proposal, num_proposals, api_key_to_use)
+        if stream_writer is not None:
+            stream_writer({"job_id": job_id})
+            job = job_service.wait(job_id, lambda token: stream_writer({"optimized_proposal_token": token}))
+        else:
+            job = job_service.wait(job_id)
 
-        optimized_text = optimize_proposal(english_proposal, dao_analysis)
-           
-        result_text = (
-            f"DAO_ANALYSIS:\n{dao_analysis}\nEND_ANALYSIS\n\n"
-            f"OPTIMIZED_PROPOSAL:\n{optimized_text}"
-        )
-        return result_text
-        
-    except ToolException as te:
-        raise ToolException(str(te))
-    except Exception as e:
-        raise ToolException(f"Error in proposal optimization process: {str(e)}")
+    if job is None:
+        raise ToolException("Error in proposal optimization process: the job was lost")
+    if job["status"] == "failed":
+        raise ToolException(job["error"])
+
+    return format_optimizer_result(job["result"])
 
 def convert_messages(messages):
     """
     Convert dictionary-based messages to LangChain message objects.
     """
+    from langchain_core.messages import SystemMessage, HumanMessage, AIMessage
+
     converted_messages = []
     
     message_types = {
@@ -689,6 +454,133 @@ def convert_messages(messages):
             
     return converted_messages
 
+# Prompt tokens the agent may be sent per request (system prompt, latest analysis and history)
+AGENT_CONTEXT_TOKENS = 16000
+# Earlier user questions quoted when older turns are dropped, and characters quoted of each
+CONTEXT_SUMMARY_QUESTIONS = 5
+CONTEXT_SUMMARY_CHARS = 150
+
+def fit_messages_to_budget(messages, max_tokens: int = AGENT_CONTEXT_TOKENS):
+    """
+    Trim a conversation (system prompt, history, current user prompt) to about
+    `max_tokens` prompt tokens. Only the latest hidden DAO analysis is kept,
+    the most recent turns are kept while they fit, and older turns are
+    replaced by a short note quoting the user's earlier questions.
+
+    Returns the trimmed messages and the estimated number of tokens saved.
+    """
+    def tokens(message):
+        return estimate_tokens(message["content"])
+
+    system_prompt, history, user_prompt = messages[0], messages[1:-1], messages[-1]
+
+    analyses = [message for message in history if message["role"] == "system"]
+    latest_analysis = analyses[-1] if analyses else None
+    used = tokens(system_prompt) + tokens(user_prompt) + (tokens(latest_analysis) if latest_analysis else 0)
+
+    kept = []
+    dropped = []
+    turns = [message for message in history if message["role"] != "system"]
+    for position in range(len(turns) - 1, -1, -1):
+        if used + tokens(turns[position]) > max_tokens:
+            dropped = turns[:position + 1]
+            break
+        kept.append(turns[position])
+        used += tokens(turns[position])
+    kept.reverse()
+
+    trimmed = [system_prompt]
+    if dropped:
+        questions = [message["content"] for message in dropped if message["role"] == "user"]
+        quoted = "\n".join(
+            f"- {question[:CONTEXT_SUMMARY_CHARS]}" for question in questions[-CONTEXT_SUMMARY_QUESTIONS:]
+        )
+        trimmed.append({
+            "role": "system",
+            "content": (
+                f"{len(dropped)} earlier messages of this conversation were omitted. "
+                f"The user's most recent earlier questions were:\n{quoted}"
+            )
+        })
+    if latest_analysis:
+        trimmed.append(latest_analysis)
+    trimmed.extend(kept)
+    trimmed.append(user_prompt)
+
+    saved = sum(tokens(message) for message in messages) - sum(tokens(message) for message in trimmed)
+    return trimmed, max(saved, 0)
+
+# Minimum seconds between two redraws of a streaming chat message
+STREAM_UPDATE_INTERVAL = 0.1
+
+def streamed_response(agent_text: str, tool_text: str) -> str:
+    """
+    Text to show while a response is streaming. The hidden DAO analysis in the
+    agent's output is never shown, and the optimized proposal streamed from
+    inside the tool is shown until the agent's own output catches up with it.
+    """
+    marker = "DAO_ANALYSIS:"
+    stripped = agent_text.lstrip()
+    if marker in agent_text or marker.startswith(stripped[:len(marker)]):
+        if "OPTIMIZED_PROPOSAL:" in agent_text:
+            agent_text = agent_text.split("OPTIMIZED_PROPOSAL:")[1].strip()
+        else:
+            agent_text = ""
+    
+    return agent_text if len(agent_text) >= len(tool_text) else tool_text
+
+def store_optimizer_response(response: str) -> str:
+    """
+    Move the hidden DAO analysis in an optimizer response into the chat history
+    as a system message and return the part to show the user.
+    """
+    # If hidden analysis is present, separate from the final output
+    if "DAO_ANALYSIS:" in response and "END_ANALYSIS" in response:
+        # Extract the analysis
+        analysis_part = response.split("DAO_ANALYSIS:")[1].split("END_ANALYSIS")[0].strip()
+        # Append hidden system message with the analysis
+        add_message({
+            "role": "system", 
+            "content": analysis_part
+        })
+        
+        # If there's an optimized proposal part, parse it out
+        if "OPTIMIZED_PROPOSAL:" in response:
+            # Show only the optimized proposal portion to user
+            response = response.split("OPTIMIZED_PROPOSAL:")[1].strip()
+        else:
+            # Fallback if something unexpected
+            response = "No optimized proposal found."
+
+    return response
+
+def forget_optimizer_job():
+    """Stop tracking this session's optimization job once its result is in the chat."""
+    if st.session_state.pop("optimizer_job", None):
+        get_session_store().set_pending_job(st.session_state.session_id, None)
+
+def stream_agent(agent_executor, messages):
+    """
+    Stream the agent's run on `messages`. The optimizer tool ends the run with
+    its result, so when the tool call was rejected instead (for example for
+    invalid arguments), the run is continued once for the chat model to
+    correct the call or ask the user.
+    """
+    from langchain_core.messages import ToolMessage
+
+    agent_input = {"messages": messages}
+    for _ in range(2):
+        final_messages = []
+        for mode, chunk in agent_executor.stream(agent_input, stream_mode=["messages", "custom", "values"]):
+            if mode == "values":
+                final_messages = chunk["messages"]
+            yield mode, chunk
+
+        last_message = final_messages[-1] if final_messages else None
+        if not (isinstance(last_message, ToolMessage) and last_message.status == "error"):
+            return
+        agent_input = {"messages": final_messages}
+
 def create_chat_completion(api_key, user_prompt, message_placeholder):
     """Create streaming chat completion using OpenAI API"""
     try:        
@@ -716,55 +608,158 @@ def create_chat_completion(api_key, user_prompt, message_placeholder):
             "content": user_prompt
         })
 
-        converted_messages = convert_messages(messages)
-        
-        model = ChatOpenAI(model="gpt-4o-mini", api_key=api_key)
-        tools = [dao_proposal_optimizer]
+        # Keep the agent's prompt within budget however long the session gets
+        messages, tokens_saved = fit_messages_to_budget(messages)
+        if tokens_saved:
+            st.sidebar.caption(f"Conversation context trimmed: ~{tokens_saved:,} tokens saved on this request")
 
         with st.spinner('Thinking...'):
-            agent_executor = create_react_agent(model, tools)
-            response = agent_executor.invoke({"messages": converted_messages})
-
-            last_response = response["messages"][-1].content
+            # The first prompt of the process also pays for importing the agent stack here
+            from langchain_core.messages import AIMessageChunk
+            from langchain_core.tools import tool
+
+            converted_messages = convert_messages(messages)
+
+            # The optimizer's result goes straight to the UI instead of being repeated by the chat model
+            tools = [tool(dao_proposal_optimizer, return_direct=True)]
+
+            # The chat model and compiled agent are built once per API key and reused across reruns
+            agent_executor = get_agent(api_key, tools)
+
+            # Agent tokens arrive in "messages" mode, the optimized proposal's tokens from
+            # inside the tool in "custom" mode, and the final agent state in "values" mode
+            agent_message_id = None
+            agent_parts = []
+            tool_parts = []
+            final_messages = []
+            last_update = 0.0
+            for mode, chunk in stream_agent(agent_executor, converted_messages):
+                if mode == "values":
+                    final_messages = chunk["messages"]
+                    continue
+                if mode == "messages":
+                    message = chunk[0]
+                    if not isinstance(message, AIMessageChunk):
+                        continue
+                    # Each of the agent's own LLM round-trips reports its usage in its last chunk
+                    if message.usage_metadata:
+                        record(
+                            llm_requests=1,
+                            prompt_tokens=message.usage_metadata.get("input_tokens", 0),
+                            completion_tokens=message.usage_metadata.get("output_tokens", 0)
+                        )
+                    if not isinstance(message.content, str):
+                        continue
+                    if message.id != agent_message_id:
+                        agent_message_id = message.id
+                        agent_parts = []
+                    agent_parts.append(message.content)
+                elif mode == "custom" and "job_id" in chunk:
+                    # Lets a later run of the script, or the restored session, pick up the job's result
+                    st.session_state.optimizer_job = chunk["job_id"]
+                    get_session_store().set_pending_job(st.session_state.session_id, chunk["job_id"])
+                    continue
+                elif mode == "custom" and "optimized_proposal_token" in chunk:
+                    tool_parts.append(chunk["optimized_proposal_token"])
+
+                # Redraw at most every STREAM_UPDATE_INTERVAL seconds rather than per token
+                now = time.monotonic()
+                if now - last_update >= STREAM_UPDATE_INTERVAL:
+                    streamed_text = streamed_response("".join(agent_parts), "".join(tool_parts))
+                    if streamed_text:
+                        message_placeholder.markdown(sanitize_dollar_signs(streamed_text) + "▌")
+                        last_update = now
         
-            # If hidden analysis is present, separate from the final output
-            if "DAO_ANALYSIS:" in last_response and "END_ANALYSIS" in last_response:
-                # Extract the analysis
-                analysis_part = last_response.split("DAO_ANALYSIS:")[1].split("END_ANALYSIS")[0].strip()
-                # Append hidden system message with the analysis
-                st.session_state.messages.append({
-                    "role": "system", 
-                    "content": analysis_part
-                })
-                
-                # If there's an optimized proposal part, parse it out
-                if "OPTIMIZED_PROPOSAL:" in last_response:
-                    # Show only the optimized proposal portion to user
-                    last_response = last_response.split("OPTIMIZED_PROPOSAL:")[1].strip()
-                else:
-                    # Fallback if something unexpected
-                    last_response = "No optimized proposal found."
+            forget_optimizer_job()
+            last_response = store_optimizer_response(final_messages[-1].content if final_messages else "")
 
             # Here we escape dollar signs so they don't get interpreted as LaTeX.
             safe_last_response = sanitize_dollar_signs(last_response)
-            
-            accumulated_response = ""
-            for char in safe_last_response:
-                accumulated_response += char
-                message_placeholder.markdown(sanitize_dollar_signs(accumulated_response) + "▌")
-
-            message_placeholder.markdown(sanitize_dollar_signs(safe_last_response))
+            message_placeholder.markdown(safe_last_response)
 
             return safe_last_response, None
 
     except Exception as e:
+        forget_optimizer_job()
         error_str = str(e).lower()
         if "insufficient_quota" in error_str or "billing" in error_str:
             return None, "Monthly API credits exhausted. Please enter your OpenAI API key in the sidebar to continue using Deo AI."
+        elif "rate limit" in error_str or "rate_limit" in error_str:
+            return None, "OpenAI is still rate limiting this API key after several retries. Please wait a minute and try again."
         else:
             return None, f"An error occurred: {str(e)}"
 
+# Seconds between two checks of an optimization job picked up after a rerun
+JOB_POLL_INTERVAL = 1.0
+
+def resume_optimizer_job(job_id: str):
+    """
+    Wait for an optimization job whose run of this script was interrupted by a
+    rerun, or that was still running when a restored session (see
+    SESSION_URL_RESTORE) was last shown, and add its result to the chat.
+    """
+    job_service = get_job_service()
+    with st.chat_message("assistant", avatar="🤖"):
+        message_placeholder = st.empty()
+        job = job_service.get(job_id)
+        while job is not None and job["status"] not in FINISHED_STATES:
+            if job["partial"]:
+                message_placeholder.markdown(sanitize_dollar_signs(job["partial"]) + "▌")
+            else:
+                message_placeholder.markdown("Optimizing your proposal...")
+            time.sleep(JOB_POLL_INTERVAL)
+            job = job_service.get(job_id)
+
+        forget_optimizer_job()
+        if job is None:
+            message_placeholder.empty()
+        elif job["status"] == "failed":
+            message_placeholder.empty()
+            st.error(f"An error occurred: {job['error']}")
+        else:
+            response = store_optimizer_response(format_optimizer_result(job["result"]))
+            safe_response = sanitize_dollar_signs(response)
+            message_placeholder.markdown(safe_response)
+            add_message({"role": "assistant", "content": safe_response})
+
+def show_request_telemetry():
+    """Sidebar panel with the startup times and the timings, bytes and tokens of this session's last request."""
+    trace = st.session_state.get("last_trace")
+    if not st.session_state.get("show_telemetry"):
+        return
+
+    first_run, last_run = startup_timings.first_run, startup_timings.last_run
+    if first_run is not None:
+        st.sidebar.caption(
+            f"Startup: imports {first_run['imports_ms']:,.0f} ms, first paint {first_run['first_paint_ms']:,.0f} ms "
+            f"on this server's first run; {last_run['imports_ms']:,.0f} ms and "
+            f"{last_run['first_paint_ms']:,.0f} ms on this rerun"
+        )
+    if trace is None:
+        return
+
+    totals = trace.totals()
+    duration = f"{trace.root.duration:,.1f} s" if trace.root.duration is not None else "still running"
+    with st.sidebar.expander("Last request", expanded=True):
+        st.caption(
+            f"{duration} · {totals['llm_requests']} LLM calls · {totals['prompt_tokens']:,} prompt and "
+            f"{totals['completion_tokens']:,} completion tokens · {totals['http_bytes'] / 1024:,.0f} KB over HTTP"
+        )
+        st.dataframe(trace.rows(), hide_index=True)
+        st.caption(
+            f"English fast path: {english_fast_path.hits} of "
+            f"{english_fast_path.hits + english_fast_path.misses} proposals skipped translation"
+        )
+        st.caption(
+            f"Shared across sessions: {analysis_cache.hits} cached analyses; {analysis_flights.waits} analyses "
+            f"and {proposal_flights.waits} Snapshot fetches joined while another session's was in flight"
+        )
+
 api_key_to_use = initialize_streamlit()
+startup_timings.record(imports_done - script_started, time.perf_counter() - script_started)
+
+# Prefetch the space directory and popular DAOs in the background, once per process
+get_warmup_worker()
 
 def main():
     api_key = api_key_to_use
@@ -774,20 +769,33 @@ def main():
     if 'dao_analysis' not in st.session_state:
         st.session_state.dao_analysis = None
     
-    # Display chat history with custom avatars
-    for message in st.session_state.messages:
+    if 'history_turns' not in st.session_state:
+        st.session_state.history_turns = CHAT_HISTORY_TURNS
+    
+    # Display only the most recent turns of the chat history with custom avatars;
+    # older turns are loaded on demand
+    history_limit = st.session_state.history_turns * 2
+    recent_messages, has_earlier = recent_chat_messages(st.session_state.messages, history_limit)
+    if len(recent_messages) < history_limit and not st.session_state.history_complete:
+        # Older turns are no longer in memory, so they are read back from the session store
+        recent_messages, has_earlier = get_session_store().recent_chat(st.session_state.session_id, history_limit)
+    if has_earlier and st.button("Show earlier messages"):
+        st.session_state.history_turns += CHAT_HISTORY_TURNS
+        st.rerun()
+    
+    for message in recent_messages:
         if message["role"] == "user":
             with st.chat_message("user", avatar="🦖"):
                 # Escape $ before displaying user messages
-                display_text = sanitize_dollar_signs(message["content"])
-                st.markdown(display_text)
-        elif message["role"] == "assistant":
-            with st.chat_message("assistant", avatar="🤖"):
-                display_text = sanitize_dollar_signs(message["content"])
-                st.markdown(display_text)
+                st.markdown(display_text(message))
         else:
-            # Skip system messages in the UI
-            pass
+            with st.chat_message("assistant", avatar="🤖"):
+                st.markdown(display_text(message))
+    
+    # An optimization still running from an interrupted run, or from before the session was restored
+    job_id = st.session_state.get("optimizer_job")
+    if job_id:
+        resume_optimizer_job(job_id)
     
     if prompt := st.chat_input("Type your message here..."):
         if not api_key:
@@ -798,12 +806,15 @@ def main():
         with st.chat_message("user", avatar="🦖"):
             safe_prompt = sanitize_dollar_signs(prompt)
             st.markdown(safe_prompt)
-        st.session_state.messages.append({"role": "user", "content": prompt})
+        add_message({"role": "user", "content": prompt})
         
         # Display assistant message with custom avatars
         with st.chat_message("assistant", avatar="🤖"):
             message_placeholder = st.empty()
-            response, error = create_chat_completion(api_key, prompt, message_placeholder)
+            with start_trace("create_chat_completion") as trace:
+                st.session_state.last_trace = trace
+                response, error = create_chat_completion(api_key, prompt, message_placeholder)
+                trace.root.error = error
             
             if error:
                 if "Monthly API credits exhausted" in error:
@@ -812,7 +823,9 @@ def main():
                     st.error(error)
             else:
                 # Store the response in chat history
-                st.session_state.messages.append({"role": "assistant", "content": response})
+                add_message({"role": "assistant", "content": response})
+    
+    show_request_telemetry()
 
 if __name__ == "__main__":
     main()
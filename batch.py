@@ -0,0 +1,184 @@
+"""
+Headless batch mode: optimize many draft proposals across many DAOs.
+
+Reads a JSONL file with one item per line:
+
+    {"id": "optional-id", "dao_name": "Aave", "proposal": "...", "num_proposals": 25}
+
+and appends one JSONL result per item to the output file as soon as it is
+done; items that fail, and input lines that are not valid items, get a
+result with their "error". Items are processed by a bounded pool of workers; items for the same
+DAO share its fetched and embedded proposals, and its analysis whenever they
+pick the same proposals to analyze. Items already present in the
+output file are skipped, so an interrupted run resumes where it stopped.
+
+Usage:
+    python batch.py drafts.jsonl results.jsonl [--workers 4]
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, Any, List, Set
+from dotenv import load_dotenv
+
+# Load environment variables from .env file
+load_dotenv()
+
+from optimizer import run_optimizer, prepare_dao_data, OptimizerError  # noqa: E402
+
+DEFAULT_NUM_PROPOSALS = 25
+
+
+def read_items(path: str) -> List[Dict[str, Any]]:
+    """
+    Read batch items, giving items without an id their line number as id.
+    A line that is not a JSON object becomes an item carrying its `error`.
+    """
+    items = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line_number, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            try:
+                item = json.loads(line)
+            except ValueError as e:
+                item = {"error": f"Invalid JSON on line {line_number}: {e}"}
+            if not isinstance(item, dict):
+                item = {"error": f"Line {line_number} is not a JSON object"}
+            item.setdefault("id", str(line_number))
+            item["id"] = str(item["id"])
+            items.append(item)
+    return items
+
+
+def completed_ids(path: str) -> Set[str]:
+    """Ids of the items that already have a successful result in the output file."""
+    done = set()
+    if path == "-" or not os.path.exists(path):
+        return done
+
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                result = json.loads(line)
+            except ValueError:
+                # A line cut short by a crash; that item runs again
+                continue
+            if not result.get("error"):
+                done.add(str(result["id"]))
+    return done
+
+
+class BatchRunner:
+    """Runs batch items on a worker pool and writes each result as soon as it is ready."""
+
+    def __init__(self, api_key: str, output, workers: int = 4):
+        self.api_key = api_key
+        self.output = output
+        self.workers = workers
+        self.succeeded = 0
+        self.failed = 0
+        self._output_lock = threading.Lock()
+        self._dao_locks: Dict[tuple, threading.Lock] = defaultdict(threading.Lock)
+        self._dao_locks_lock = threading.Lock()
+
+    def run(self, items: List[Dict[str, Any]]) -> None:
+        started = time.monotonic()
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="deo-batch") as executor:
+            futures = [executor.submit(self.process, item) for item in items]
+            for count, future in enumerate(as_completed(futures), start=1):
+                future.result()
+                elapsed = time.monotonic() - started
+                print(
+                    f"[{count}/{len(items)}] {self.succeeded} ok, {self.failed} failed, "
+                    f"{count / elapsed * 60:.1f} items/min",
+                    file=sys.stderr
+                )
+
+    def process(self, item: Dict[str, Any]) -> None:
+        started = time.monotonic()
+        dao_name = item.get("dao_name", "")
+        result = {"id": item["id"], "dao_name": dao_name, "num_proposals": item.get("num_proposals")}
+
+        # Any failure only fails this item; the rest of the batch carries on
+        try:
+            if item.get("error"):
+                raise OptimizerError(item["error"])
+            try:
+                num_proposals = int(item.get("num_proposals") or DEFAULT_NUM_PROPOSALS)
+            except (TypeError, ValueError):
+                raise OptimizerError(f"num_proposals must be a whole number, not {item['num_proposals']!r}")
+            result["num_proposals"] = num_proposals
+
+            # The first item for a DAO fetches and indexes its proposals while later items
+            # for the same DAO wait, then find them in the shared proposal store and index
+            with self._dao_lock(dao_name, num_proposals):
+                prepare_dao_data(dao_name, num_proposals, self.api_key)
+
+            optimized = run_optimizer(dao_name, item.get("proposal", ""), num_proposals, self.api_key)
+            result.update(optimized)
+            result["error"] = None
+        except OptimizerError as e:
+            result["error"] = str(e)
+        except Exception as e:
+            result["error"] = f"Unexpected error: {e}"
+
+        result["elapsed"] = round(time.monotonic() - started, 3)
+        self.write(result)
+
+    def write(self, result: Dict[str, Any]) -> None:
+        with self._output_lock:
+            if result["error"]:
+                self.failed += 1
+            else:
+                self.succeeded += 1
+            self.output.write(json.dumps(result) + "\n")
+            self.output.flush()
+            if self.output is not sys.stdout:
+                os.fsync(self.output.fileno())
+
+    def _dao_lock(self, dao_name: str, num_proposals: int) -> threading.Lock:
+        with self._dao_locks_lock:
+            return self._dao_locks[(dao_name.strip().lower(), num_proposals)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("input", help="JSONL file of {dao_name, proposal, num_proposals} items")
+    parser.add_argument("output", help="JSONL file results are appended to, or - for stdout")
+    parser.add_argument("--workers", type=int, default=4, help="items optimized at the same time")
+    args = parser.parse_args()
+
+    api_key = os.environ.get("OPENAI_API_KEY")
+    if not api_key:
+        parser.error("OPENAI_API_KEY must be set in the environment or .env file")
+
+    items = read_items(args.input)
+    done = completed_ids(args.output)
+    pending = [item for item in items if item["id"] not in done]
+    print(f"{len(items)} items, {len(items) - len(pending)} already done, {len(pending)} to run", file=sys.stderr)
+
+    started = time.monotonic()
+    output = sys.stdout if args.output == "-" else open(args.output, "a", encoding="utf-8")
+    try:
+        runner = BatchRunner(api_key, output, workers=args.workers)
+        runner.run(pending)
+    finally:
+        if output is not sys.stdout:
+            output.close()
+
+    elapsed = time.monotonic() - started
+    rate = len(pending) / elapsed * 60 if elapsed > 0 else 0.0
+    print(
+        f"done: {runner.succeeded} ok, {runner.failed} failed in {elapsed:.1f}s ({rate:.1f} items/min)",
+        file=sys.stderr
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,389 @@
+"""
+Stage-level latency benchmark of the proposal optimization pipeline.
+
+Runs the real pipeline (get_space_id, get_dao_data, translate_proposal,
+select_relevant_proposals, analyze_dao_data, optimize_proposal and
+run_optimizer end to end) against
+a local fake Snapshot GraphQL server and a fake OpenAI-compatible endpoint,
+both with configurable latency and payload sizes, and reports p50/p95 per
+stage. Runs offline; no API keys are needed.
+
+Every iteration starts cold (empty space directory, proposal store,
+embedding index and analysis cache) unless --warm-snapshot keeps the
+Snapshot-side state and embeddings between iterations. The fake space holds
+as many proposals as a request fetches (more than --proposals when
+RETRIEVAL_POOL_FACTOR turns retrieval on). The end-to-end run starts from the same state as the stages.
+
+Usage:
+    python benchmarks/bench_pipeline.py [--spaces 10000] [--proposals 1000] [--iterations 10]
+        [--snapshot-latency 50] [--openai-latency 300] [--tokens-per-second 500] [--json]
+
+Set DAO_DATA_PROFILE=minimal|standard|full to compare the Snapshot field profiles.
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Any, List
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+BENCH_SPACE_NAME = "Benchmark DAO"
+BENCH_SPACE_ID = "benchmark.eth"
+WORDS = (
+    "treasury grant proposal vote delegate budget quorum funding protocol upgrade community "
+    "incentive liquidity council multisig audit roadmap token emission parameter risk"
+).split()
+
+STAGES = [
+    "get_space_id", "get_dao_data", "translate_proposal", "select_relevant_proposals",
+    "analyze_dao_data", "optimize_proposal", "end_to_end"
+]
+
+
+def make_text(rng: random.Random, chars: int) -> str:
+    words = []
+    length = 0
+    while length < chars:
+        word = rng.choice(WORDS)
+        words.append(word)
+        length += len(word) + 1
+    return " ".join(words)[:chars]
+
+
+def make_spaces(count: int) -> List[Dict[str, Any]]:
+    spaces = [{"id": f"space{i}.eth", "name": f"Space {i} Collective", "created": i + 1} for i in range(count - 1)]
+    spaces.append({"id": BENCH_SPACE_ID, "name": BENCH_SPACE_NAME, "created": count})
+    return spaces
+
+
+def make_space() -> Dict[str, Any]:
+    return {
+        "id": BENCH_SPACE_ID,
+        "name": BENCH_SPACE_NAME,
+        "about": "A synthetic space for benchmarks.",
+        "avatar": None,
+        "network": "1",
+        "symbol": "BENCH",
+        "strategies": [{"name": "erc20-balance-of", "params": {"symbol": "BENCH", "decimals": 18}}],
+        "admins": [f"0x{i:040x}" for i in range(5)],
+        "moderators": [],
+        "members": [f"0x{i:040x}" for i in range(20)],
+        "filters": {"minScore": 0, "onlyMembers": False},
+        "plugins": {}
+    }
+
+
+def make_proposals(count: int, body_chars: int, rng: random.Random) -> List[Dict[str, Any]]:
+    proposals = []
+    for i in range(count):
+        created = 1_700_000_000 - i * 3600
+        scores = [rng.uniform(0, 1e6) for _ in range(3)]
+        proposals.append({
+            "id": f"0x{i:064x}",
+            "title": make_text(rng, 60),
+            "body": make_text(rng, body_chars),
+            "choices": ["For", "Against", "Abstain"],
+            "start": created,
+            "end": created + 3 * 24 * 3600,
+            "snapshot": str(18_000_000 + i),
+            "state": "closed",
+            "author": f"0x{i % 50:040x}",
+            "created": created,
+            "scores": scores,
+            "scores_total": sum(scores)
+        })
+    return proposals
+
+
+class FakeServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, handler, latency: float, **data):
+        super().__init__(("127.0.0.1", 0), handler)
+        self.latency = latency
+        self.requests = 0
+        self.bytes_sent = 0
+        self.counter_lock = threading.Lock()
+        for name, value in data.items():
+            setattr(self, name, value)
+
+    def handle_error(self, request, client_address):
+        # Clients closing idle keep-alive connections are expected
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def serve_in_background(self) -> "FakeServer":
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+
+class JSONHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def read_json(self) -> Dict[str, Any]:
+        with self.server.counter_lock:
+            self.server.requests += 1
+        return json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)) or b"{}")
+
+    def send_json(self, payload: Dict[str, Any]) -> None:
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        with self.server.counter_lock:
+            self.server.bytes_sent += len(body)
+
+
+class SnapshotHandler(JSONHandler):
+    """Answers the spaces listing, space data and proposal changes queries snapshot.py sends."""
+
+    def do_POST(self):
+        request = self.read_json()
+        query, variables = request["query"], request.get("variables") or {}
+        time.sleep(self.server.latency)
+        proposals = self.server.proposals
+        if "body" not in query:
+            # The minimal field profile asks for proposals without their bodies
+            proposals = [{k: v for k, v in p.items() if k not in ("body", "snapshot")} for p in proposals]
+
+        if "GetProposalChanges" in query:
+            data = {
+                "proposals": [p for p in proposals if p["created"] > variables["created_gt"]][:1000]
+            }
+            if variables.get("with_space"):
+                data["space"] = self.server.space
+            if variables.get("with_open"):
+                open_ids = set(variables.get("open_ids") or [])
+                data["open"] = [p for p in proposals if p["id"] in open_ids]
+        elif "GetSpaceData" in query:
+            found = variables["space_id"] == BENCH_SPACE_ID
+            data = {
+                "space": self.server.space if found else None,
+                "proposals": proposals[:variables["num_proposals"]] if found else []
+            }
+        elif "spaces(" in query:
+            spaces = [s for s in self.server.spaces if s["created"] > variables.get("created_gt", 0)]
+            data = {"spaces": spaces[variables["skip"]:variables["skip"] + 1000]}
+        else:
+            data = {}
+
+        self.send_json({"data": data})
+
+
+class OpenAIHandler(JSONHandler):
+    """
+    Chat completions endpoint: a fixed delay, then completion tokens at
+    `tokens_per_second`. Embeddings are bag-of-words vectors, so texts sharing
+    words are similar.
+    """
+
+    EMBEDDING_DIMENSIONS = 256
+
+    def do_POST(self):
+        request = self.read_json()
+        if self.path.endswith("/embeddings"):
+            time.sleep(self.server.latency)
+            self.send_json({
+                "object": "list",
+                "model": request.get("model"),
+                "data": [
+                    {"object": "embedding", "index": index, "embedding": self.embed(text)}
+                    for index, text in enumerate(request["input"])
+                ],
+                "usage": {"prompt_tokens": sum(len(text) // 4 for text in request["input"]),
+                          "total_tokens": sum(len(text) // 4 for text in request["input"])}
+            })
+            return
+
+        prompt_chars = sum(len(message.get("content") or "") for message in request.get("messages", []))
+        tokens = [word + " " for word in make_text(random.Random(prompt_chars), self.server.completion_tokens * 6).split()]
+        tokens = tokens[:self.server.completion_tokens]
+        usage = {
+            "prompt_tokens": prompt_chars // 4,
+            "completion_tokens": len(tokens),
+            "total_tokens": prompt_chars // 4 + len(tokens)
+        }
+        time.sleep(self.server.latency)
+
+        if not request.get("stream"):
+            time.sleep(len(tokens) / self.server.tokens_per_second)
+            self.send_json({
+                "id": "chatcmpl-bench",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": request.get("model"),
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": "".join(tokens)},
+                    "finish_reason": "stop"
+                }],
+                "usage": usage
+            })
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for token in tokens:
+            time.sleep(1 / self.server.tokens_per_second)
+            self.send_chunk({
+                "id": "chatcmpl-bench",
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": request.get("model"),
+                "choices": [{"index": 0, "delta": {"content": token}, "finish_reason": None}]
+            })
+        if (request.get("stream_options") or {}).get("include_usage"):
+            self.send_chunk({
+                "id": "chatcmpl-bench",
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": request.get("model"),
+                "choices": [],
+                "usage": usage
+            })
+        self.send_chunk("[DONE]")
+        self.wfile.write(b"0\r\n\r\n")
+
+    def embed(self, text: str) -> List[float]:
+        vector = [0.0] * self.EMBEDDING_DIMENSIONS
+        for word in text.lower().split():
+            vector[sum(word.encode("utf-8")) % self.EMBEDDING_DIMENSIONS] += 1.0
+        return vector
+
+    def send_chunk(self, payload) -> None:
+        event = f"data: {payload if isinstance(payload, str) else json.dumps(payload)}\n\n".encode("utf-8")
+        self.wfile.write(f"{len(event):x}\r\n".encode("ascii") + event + b"\r\n")
+        self.wfile.flush()
+        with self.server.counter_lock:
+            self.server.bytes_sent += len(event)
+
+
+def percentile(values: List[float], share: float) -> float:
+    """Nearest-rank percentile of `values`."""
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, round(share * len(ordered) + 0.5) - 1))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--spaces", type=int, default=10000)
+    parser.add_argument("--proposals", type=int, default=1000, help="proposals analyzed per run")
+    parser.add_argument("--body-chars", type=int, default=1500, help="characters in each proposal body")
+    parser.add_argument("--iterations", type=int, default=10)
+    parser.add_argument("--snapshot-latency", type=float, default=50, help="ms per Snapshot request")
+    parser.add_argument("--openai-latency", type=float, default=300, help="ms to the first completion token")
+    parser.add_argument("--tokens-per-second", type=float, default=500, help="completion tokens per second")
+    parser.add_argument("--completion-tokens", type=int, default=300)
+    parser.add_argument("--warm-snapshot", action="store_true",
+                        help="keep the space directory and proposal store between iterations")
+    parser.add_argument("--json", action="store_true", help="print the results as JSON")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    snapshot_server = FakeServer(
+        SnapshotHandler, args.snapshot_latency / 1000,
+        spaces=make_spaces(args.spaces), space=make_space(), proposals=[]
+    ).serve_in_background()
+    openai_server = FakeServer(
+        OpenAIHandler, args.openai_latency / 1000,
+        completion_tokens=args.completion_tokens, tokens_per_second=args.tokens_per_second
+    ).serve_in_background()
+
+    # Point the pipeline at the fakes before its modules read their settings
+    os.environ["SNAPSHOT_API_URL"] = f"{snapshot_server.url}/graphql"
+    os.environ["OPENAI_BASE_URL"] = f"{openai_server.url}/v1"
+    for name in ("SPACE_DIRECTORY_PATH", "PROPOSAL_STORE_DIR", "ANALYSIS_CACHE_DIR"):
+        os.environ.pop(name, None)
+    # Measure the pipeline, not the client-side rate limiter
+    os.environ.setdefault("LLM_REQUESTS_PER_MINUTE", "1000000")
+    os.environ.setdefault("LLM_TOKENS_PER_MINUTE", "1000000000")
+
+    import optimizer
+    import retrieval
+    from analysis import analysis_cache
+    from snapshot import SpaceDirectory, ProposalStore
+    from retrieval import ProposalIndex, retrieval_pool_size
+
+    pool_size = retrieval_pool_size(args.proposals)
+    snapshot_server.proposals = make_proposals(pool_size, args.body_chars, rng)
+
+    api_key = "sk-benchmark"
+    proposal = make_text(rng, 1200)
+    timings: Dict[str, List[float]] = {stage: [] for stage in STAGES}
+
+    def reset(keep_snapshot: bool) -> None:
+        analysis_cache.clear()
+        if not keep_snapshot:
+            optimizer.space_directory = SpaceDirectory(path=None)
+            optimizer.proposal_store = ProposalStore(path=None)
+            optimizer.proposal_index = retrieval.proposal_index = ProposalIndex(path=None)
+
+    def timed(stage: str, fn, *fn_args):
+        start = time.perf_counter()
+        result = fn(*fn_args)
+        timings[stage].append(time.perf_counter() - start)
+        return result
+
+    for iteration in range(args.iterations):
+        keep_snapshot = args.warm_snapshot and iteration > 0
+        reset(keep_snapshot)
+        space_id = timed("get_space_id", optimizer.get_space_id, BENCH_SPACE_NAME)
+        dao_data = timed("get_dao_data", optimizer.get_dao_data, space_id, pool_size)
+        english_proposal = timed("translate_proposal", optimizer.translate_proposal, proposal, api_key)
+        dao_data = timed(
+            "select_relevant_proposals", optimizer.select_relevant_proposals,
+            dao_data, english_proposal, args.proposals, api_key
+        )
+        dao_analysis = timed("analyze_dao_data", optimizer.analyze_dao_data, dao_data, api_key)
+        timed("optimize_proposal", optimizer.optimize_proposal, english_proposal, dao_analysis, api_key)
+
+        reset(args.warm_snapshot)
+        timed("end_to_end", optimizer.run_optimizer, BENCH_SPACE_NAME, proposal, args.proposals, api_key)
+
+    results = {
+        stage: {"p50_ms": percentile(values, 0.5) * 1000, "p95_ms": percentile(values, 0.95) * 1000}
+        for stage, values in timings.items()
+    }
+    summary = {
+        "iterations": args.iterations,
+        "spaces": args.spaces,
+        "proposals": args.proposals,
+        "proposal_pool": pool_size,
+        "snapshot_requests": snapshot_server.requests,
+        "snapshot_bytes": snapshot_server.bytes_sent,
+        "openai_requests": openai_server.requests,
+        "stages": results
+    }
+
+    if args.json:
+        print(json.dumps(summary, indent=2))
+        return
+
+    print(f"spaces: {args.spaces}  proposals: {args.proposals} of {pool_size}  iterations: {args.iterations}  "
+          f"snapshot state: {'warm' if args.warm_snapshot else 'cold'}")
+    print(f"snapshot: {snapshot_server.requests} requests, {snapshot_server.bytes_sent / 1e6:.1f} MB  "
+          f"openai: {openai_server.requests} requests")
+    print(f"{'stage':<28}{'p50 ms':>10}{'p95 ms':>10}")
+    for stage, result in results.items():
+        print(f"{stage:<28}{result['p50_ms']:>10.1f}{result['p95_ms']:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
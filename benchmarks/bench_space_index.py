@@ -0,0 +1,117 @@
+"""
+Compare the trigram SpaceNameIndex against the original linear difflib scan.
+
+Builds a synthetic directory of verified spaces, resolves a set of DAO names
+(exact names, ids, typos and partial names) both ways and reports per-lookup
+latency, how often the two approaches pick the same space and how often
+the index's pick scores as well as the scan's. Exits with an error unless
+every lookup resolves to the same space as the scan.
+
+Usage:
+    python benchmarks/bench_space_index.py [--spaces 20000] [--queries 200]
+"""
+import os
+import sys
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from snapshot import SpaceNameIndex, calculate_similarity  # noqa: E402
+
+SYLLABLES = [
+    "ba", "ra", "ko", "zu", "ne", "li", "ma", "to", "fi", "xa", "qu", "de", "vo", "si", "pe",
+    "lo", "gra", "ten", "mox", "dry", "sol", "ark", "nim", "vel", "tor", "sha", "zen", "quo",
+]
+SUFFIXES = ["", "", "", " DAO", " Protocol", " Finance", " Labs", " Governance", " Collective", " Club"]
+
+
+def make_word(rng: random.Random) -> str:
+    return "".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4)))
+
+
+def make_spaces(count: int, rng: random.Random):
+    spaces = []
+    for i in range(count):
+        words = [make_word(rng) for _ in range(rng.randint(1, 2))]
+        name = " ".join(word.capitalize() for word in words) + rng.choice(SUFFIXES)
+        space_id = f"{''.join(words)}.eth" if rng.random() < 0.8 else f"{words[0]}{i}.eth"
+        spaces.append({"id": space_id, "name": name, "created": i})
+    return spaces
+
+
+def make_queries(spaces, count: int, rng: random.Random):
+    queries = []
+    for space in rng.sample(spaces, count):
+        variant = rng.randint(0, 3)
+        if variant == 0:
+            queries.append(space["name"])
+        elif variant == 1:
+            queries.append(space["id"])
+        elif variant == 2 and len(space["name"]) > 4:
+            position = rng.randrange(len(space["name"]))
+            queries.append(space["name"][:position] + space["name"][position + 1:])
+        else:
+            queries.append(space["name"].lower().replace(" dao", ""))
+    return queries
+
+
+def linear_scan(spaces, dao_name: str):
+    matches = []
+    for space in spaces:
+        matches.append((calculate_similarity(dao_name, space["name"], space["id"]), space["id"], space["name"]))
+    matches.sort(reverse=True)
+    return matches[0] if matches else None
+
+
+def resolved(match):
+    return match[1] if match and match[0] > 0.6 else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--spaces", type=int, default=20000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    spaces = make_spaces(args.spaces, rng)
+    queries = make_queries(spaces, min(args.queries, len(spaces)), rng)
+
+    start = time.perf_counter()
+    index = SpaceNameIndex(spaces)
+    build_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    scan_matches = [linear_scan(spaces, query) for query in queries]
+    scan_time = (time.perf_counter() - start) / len(queries)
+
+    start = time.perf_counter()
+    index_matches = [index.best_match(query) for query in queries]
+    index_time = (time.perf_counter() - start) / len(queries)
+
+    agreement = sum(resolved(a) == resolved(b) for a, b in zip(scan_matches, index_matches)) / len(queries)
+    same_score = sum(
+        resolved(a) == resolved(b) or (resolved(b) is not None and a[0] == b[0])
+        for a, b in zip(scan_matches, index_matches)
+    ) / len(queries)
+
+    print(f"spaces: {len(spaces)}  queries: {len(queries)}")
+    print(f"index build:        {build_time * 1000:.1f} ms")
+    print(f"linear scan lookup: {scan_time * 1000:.2f} ms")
+    print(f"index lookup:       {index_time * 1000:.2f} ms")
+    print(f"speedup:            {scan_time / index_time:.1f}x")
+    print(f"same resolution:    {agreement:.1%}")
+    print(f"as good a match:    {same_score:.1%}")
+
+    if agreement < 1:
+        for query, scan_match, index_match in zip(queries, scan_matches, index_matches):
+            if resolved(scan_match) != resolved(index_match):
+                print(f"  {query!r}: scan {scan_match}, index {index_match}", file=sys.stderr)
+        sys.exit("the index does not resolve every query to the same space as the linear scan")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+Cold start benchmark of the Streamlit app.
+
+Runs app.py with Streamlit's AppTest harness in fresh interpreters, once
+cold and then once more as a rerun in the same process, and reports p50/p95
+of the import and first-paint times the app records for its startup report
+(telemetry.startup_timings), the whole first run, and which heavy LLM
+modules were imported before the first prompt. Runs offline; background
+warm-up is turned off and the job and session databases go to a temporary
+directory.
+
+Usage:
+    python benchmarks/bench_startup.py [--iterations 5] [--json]
+"""
+import os
+import sys
+import json
+import argparse
+import tempfile
+import subprocess
+from typing import Dict, List
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+HEAVY_MODULES = ("openai", "langchain_core", "langchain_openai", "langgraph")
+
+# Run in a fresh interpreter so every iteration pays the imports from scratch
+CHILD = """
+import os, sys, json, time
+sys.path.insert(0, {root!r})
+started = time.perf_counter()
+from streamlit.testing.v1 import AppTest
+app_test = AppTest.from_file(os.path.join({root!r}, "app.py"), default_timeout=120)
+app_test.run()
+first_run = time.perf_counter() - started
+heavy = [name for name in {heavy!r} if name in sys.modules]
+app_test.run()
+from telemetry import startup_timings
+print(json.dumps({{
+    "first_run_ms": first_run * 1000,
+    "imports_ms": startup_timings.first_run["imports_ms"],
+    "first_paint_ms": startup_timings.first_run["first_paint_ms"],
+    "rerun_imports_ms": startup_timings.last_run["imports_ms"],
+    "rerun_first_paint_ms": startup_timings.last_run["first_paint_ms"],
+    "heavy_modules": heavy
+}}))
+"""
+
+
+def percentile(values: List[float], share: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(share * len(ordered)))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=5)
+    parser.add_argument("--json", action="store_true", help="print the results as JSON")
+    args = parser.parse_args()
+
+    runs = []
+    with tempfile.TemporaryDirectory() as tmp:
+        env = {
+            **os.environ,
+            "WARMUP_INTERVAL": "0",
+            "JOB_DB_PATH": os.path.join(tmp, "jobs.sqlite3"),
+            "SESSION_STORE_PATH": os.path.join(tmp, "sessions.sqlite3")
+        }
+        child = CHILD.format(root=os.path.abspath(ROOT), heavy=HEAVY_MODULES)
+        for _ in range(args.iterations):
+            output = subprocess.run(
+                [sys.executable, "-c", child], env=env, cwd=tmp, capture_output=True, text=True, check=True
+            ).stdout
+            runs.append(json.loads(output.strip().splitlines()[-1]))
+
+    metrics = ("first_run_ms", "imports_ms", "first_paint_ms", "rerun_imports_ms", "rerun_first_paint_ms")
+    results: Dict[str, Dict[str, float]] = {
+        metric: {
+            "p50_ms": percentile([run[metric] for run in runs], 0.5),
+            "p95_ms": percentile([run[metric] for run in runs], 0.95)
+        }
+        for metric in metrics
+    }
+    heavy = sorted({name for run in runs for name in run["heavy_modules"]})
+
+    if args.json:
+        print(json.dumps({"iterations": args.iterations, "metrics": results, "heavy_modules": heavy}, indent=2))
+        return
+
+    print(f"iterations: {args.iterations}  heavy modules imported before the first prompt: {', '.join(heavy) or 'none'}")
+    print(f"{'metric':<24}{'p50 ms':>10}{'p95 ms':>10}")
+    for metric, result in results.items():
+        print(f"{metric:<24}{result['p50_ms']:>10.1f}{result['p95_ms']:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
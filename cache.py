@@ -0,0 +1,162 @@
+import os
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional
+
+
+class TTLCache:
+    """
+    Thread-safe in-memory cache with size (least recently used) and age eviction.
+
+    If `path` is set, entries are also written there as JSON files, so values
+    must be JSON serializable. Entries missing from memory are looked up on
+    disk, which lets the cache survive restarts and be shared between
+    processes on one machine.
+    """
+
+    def __init__(self, max_entries: int = 128, ttl: float = 24 * 60 * 60, path: Optional[str] = None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: str) -> Optional[Any]:
+        """Return the cached value for `key`, or None if it is missing or expired."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.time() - entry[0] > self.ttl:
+                del self._entries[key]
+                entry = None
+
+            if entry is None:
+                entry = self._load(key)
+                if entry is not None:
+                    self._entries[key] = entry
+                    self._evict()
+
+            if entry is None:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key: str, value: Any) -> None:
+        entry = (time.time(), value)
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            self._evict()
+        self._save(key, entry)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def _evict(self) -> None:
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _file_path(self, key: str) -> str:
+        return os.path.join(self.path, hashlib.sha256(key.encode("utf-8")).hexdigest() + ".json")
+
+    def _load(self, key: str) -> Optional[tuple]:
+        if not self.path:
+            return None
+
+        try:
+            with open(self._file_path(key), "r", encoding="utf-8") as f:
+                stored = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        if stored.get("key") != key or time.time() - stored.get("stored_at", 0) > self.ttl:
+            return None
+        return (stored["stored_at"], stored["value"])
+
+    def _save(self, key: str, entry: tuple) -> None:
+        if not self.path:
+            return
+
+        tmp_path = f"{self._file_path(key)}.{threading.get_ident()}.tmp"
+        try:
+            os.makedirs(self.path, exist_ok=True)
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"key": key, "stored_at": entry[0], "value": entry[1]}, f)
+            os.replace(tmp_path, self._file_path(key))
+            self._prune_disk()
+        except OSError:
+            pass
+
+    def _prune_disk(self) -> None:
+        # Apply the same size and age limits to the files, dropping the oldest first
+        files = [os.path.join(self.path, name) for name in os.listdir(self.path) if name.endswith(".json")]
+        files.sort(key=os.path.getmtime, reverse=True)
+        now = time.time()
+        for position, file_path in enumerate(files):
+            if position >= self.max_entries or now - os.path.getmtime(file_path) > self.ttl:
+                try:
+                    os.remove(file_path)
+                except OSError:
+                    pass
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls for the same key: the first caller runs the
+    function and callers arriving while it runs wait for it and share its
+    result, or its exception, instead of repeating the work.
+
+    `runs` counts calls that did the work and `waits` those that shared an
+    in-flight result.
+    """
+
+    def __init__(self):
+        self.runs = 0
+        self.waits = 0
+        self._calls: Dict[str, "_Call"] = {}
+        self._lock = threading.Lock()
+
+    def do(self, key: str, fn: Callable[[], Any]) -> Any:
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.runs += 1
+            else:
+                self.waits += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.value
+
+        try:
+            call.value = fn()
+            return call.value
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.value: Any = None
+        self.error: Optional[BaseException] = None
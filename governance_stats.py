@@ -0,0 +1,221 @@
+import os
+import re
+import json
+import hashlib
+from collections import Counter
+from typing import Dict, Any, List, Optional
+import numpy as np
+from cache import TTLCache
+
+# Statistics kept per DAO and proposal set, and for how long
+GOVERNANCE_STATS_CACHE_SIZE = int(os.environ.get("GOVERNANCE_STATS_CACHE_SIZE", 256))
+GOVERNANCE_STATS_CACHE_TTL = int(os.environ.get("GOVERNANCE_STATS_CACHE_TTL", 60 * 60))
+
+# Sections listed in the statistics table
+TOP_SECTIONS = 8
+
+_YES = re.compile(r"^\s*(for|yes|yay|yae|aye|approve|accept|support|in favou?r)\b", re.IGNORECASE)
+_NO = re.compile(r"^\s*(against|no|nay|reject|deny|oppose|abstain)\b", re.IGNORECASE)
+_HEADING = re.compile(r"^#+\s*(.+?)\s*#*$", re.MULTILINE)
+_LATER_SECTIONS = re.compile(r"\[later sections: ([^\]]*)\]")
+
+
+def proposal_outcome(proposal: Dict[str, Any]) -> str:
+    """'passed', 'failed', 'no votes', 'open' or, when the choices are not for/against, 'other'."""
+    if proposal.get("state") in ("pending", "active"):
+        return "open"
+    scores = proposal.get("scores") or []
+    choices = proposal.get("choices") or []
+    if not scores or not proposal.get("scores_total"):
+        return "no votes"
+
+    winner = choices[int(np.argmax(scores))] if len(choices) == len(scores) else ""
+    if _YES.match(str(winner)):
+        return "passed"
+    if _NO.match(str(winner)):
+        return "failed"
+    return "other"
+
+
+def proposal_sections(proposal: Dict[str, Any]) -> List[str]:
+    body = proposal.get("body") or ""
+    sections = [heading.strip().lower() for heading in _HEADING.findall(body)]
+    # Bodies shortened by prune_dao_data list the headings of the part that was cut
+    for later in _LATER_SECTIONS.findall(body):
+        sections.extend(section.strip().lower() for section in later.split("|"))
+    return sections
+
+
+def _quartiles(values: np.ndarray) -> Optional[List[float]]:
+    return np.percentile(values, [25, 50, 75]).tolist() if len(values) else None
+
+
+def _median(values: np.ndarray) -> Optional[float]:
+    return float(np.median(values)) if len(values) else None
+
+
+def compute_governance_stats(proposals: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Exact outcome, turnout, duration, length, section and author statistics of `proposals`."""
+    outcomes = np.array([proposal_outcome(p) for p in proposals], dtype=object)
+    totals = np.array([float(p.get("scores_total") or 0) for p in proposals])
+    top_scores = np.array([float(max(p.get("scores") or [0])) for p in proposals])
+    durations = np.array([((p.get("end") or 0) - (p.get("start") or 0)) / 86400 for p in proposals])
+    lengths = np.array([
+        float(p["body_length"] if p.get("body_length") is not None else len(p.get("body") or ""))
+        for p in proposals
+    ])
+    has_body = np.array([p.get("body_length") is not None or "body" in p for p in proposals], dtype=bool)
+    choice_counts = Counter(len(p.get("choices") or []) for p in proposals)
+
+    passed = outcomes == "passed"
+    failed = outcomes == "failed"
+    voted = totals > 0
+    decided = passed | failed
+
+    authors = [p.get("author") or "" for p in proposals]
+    author_counts = Counter(authors)
+    repeat = np.array([author_counts[author] > 1 for author in authors], dtype=bool)
+
+    section_counts = Counter()
+    for proposal in proposals:
+        section_counts.update(set(proposal_sections(proposal)))
+
+    def pass_rate(mask: np.ndarray) -> Optional[float]:
+        decided_in_mask = int((decided & mask).sum())
+        return float((passed & mask).sum()) / decided_in_mask if decided_in_mask else None
+
+    return {
+        "proposals": len(proposals),
+        "outcomes": {outcome: int((outcomes == outcome).sum()) for outcome in
+                     ("passed", "failed", "other", "no votes", "open")},
+        "pass_rate": pass_rate(np.ones(len(proposals), dtype=bool)),
+        "votes": {
+            "quartiles": _quartiles(totals[voted]),
+            "passed_median": _median(totals[passed]),
+            "failed_median": _median(totals[failed])
+        },
+        "winning_share": {
+            "quartiles": _quartiles(top_scores[voted] / totals[voted]),
+            "passed_median": _median(top_scores[passed & voted] / totals[passed & voted]),
+            "failed_median": _median(top_scores[failed & voted] / totals[failed & voted])
+        },
+        "duration_days": {
+            "quartiles": _quartiles(durations),
+            "passed_median": _median(durations[passed]),
+            "failed_median": _median(durations[failed])
+        },
+        "body_length": {
+            "quartiles": _quartiles(lengths[has_body]),
+            "passed_median": _median(lengths[passed & has_body]),
+            "failed_median": _median(lengths[failed & has_body])
+        },
+        "choices": choice_counts.most_common(1)[0][0] if choice_counts else None,
+        "sections": [
+            (section, count / len(proposals)) for section, count in section_counts.most_common(TOP_SECTIONS)
+        ] if proposals else [],
+        "authors": {
+            "unique": len(author_counts),
+            "repeat_author_share": float(repeat.mean()) if len(proposals) else None,
+            "top5_share": sum(count for _, count in author_counts.most_common(5)) / len(proposals) if proposals else None,
+            "pass_rate_repeat": pass_rate(repeat),
+            "pass_rate_first_time": pass_rate(~repeat)
+        }
+    }
+
+
+def _number(value: Optional[float], percent: bool = False) -> str:
+    if value is None:
+        return "-"
+    if percent:
+        return f"{value:.0%}"
+    return f"{value:,.1f}" if abs(value) < 100 else f"{value:,.0f}"
+
+
+def format_stats_table(stats: Dict[str, Any]) -> str:
+    """Compact plain-text table of `stats` for the analysis prompt."""
+    rows = [
+        ("votes cast (scores_total)", stats["votes"], False),
+        ("winning choice share", stats["winning_share"], True),
+        ("voting duration (days)", stats["duration_days"], False),
+        ("body length (characters)", stats["body_length"], False)
+    ]
+    lines = [
+        f"Computed exactly from {stats['proposals']} proposals:",
+        "metric | 25th percentile | median | 75th percentile | median when passed | median when failed"
+    ]
+    for name, metric, percent in rows:
+        quartiles = metric["quartiles"] or [None, None, None]
+        lines.append(" | ".join(
+            [name] + [_number(value, percent) for value in quartiles]
+            + [_number(metric["passed_median"], percent), _number(metric["failed_median"], percent)]
+        ))
+
+    outcomes = stats["outcomes"]
+    authors = stats["authors"]
+    lines.append(
+        f"outcomes: {outcomes['passed']} passed, {outcomes['failed']} failed, {outcomes['other']} multiple-choice, "
+        f"{outcomes['no votes']} without votes, {outcomes['open']} still open; "
+        f"pass rate of for/against proposals {_number(stats['pass_rate'], True)}"
+    )
+    lines.append(
+        f"authors: {authors['unique']} unique; {_number(authors['repeat_author_share'], True)} of proposals by "
+        f"repeat authors; top 5 authors wrote {_number(authors['top5_share'], True)}; pass rate "
+        f"{_number(authors['pass_rate_repeat'], True)} for repeat authors and "
+        f"{_number(authors['pass_rate_first_time'], True)} for first-time authors"
+    )
+    if stats["choices"] is not None:
+        lines.append(f"most common number of choices: {stats['choices']}")
+    if stats["sections"]:
+        lines.append("most common sections: " + ", ".join(
+            f"{section} ({_number(share, True)})" for section, share in stats["sections"]
+        ))
+    return "\n".join(lines)
+
+
+def compact_proposal(proposal: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    The proposal as shown to the analysis model: raw timestamps and score
+    arrays are replaced by its outcome, winning choice share, votes cast and
+    voting duration, which the model would otherwise have to work out itself.
+    """
+    outcome = proposal_outcome(proposal)
+    # A for/against outcome already says what the choices and the winner were
+    dropped = ("start", "end", "scores", "scores_total", "snapshot") + (
+        ("choices",) if outcome in ("passed", "failed") else ()
+    )
+    compact = {key: value for key, value in proposal.items() if key not in dropped}
+    compact["outcome"] = outcome
+    scores = proposal.get("scores") or []
+    total = proposal.get("scores_total") or 0
+    if scores and total:
+        winner = int(np.argmax(scores))
+        choices = proposal.get("choices") or []
+        if outcome not in ("passed", "failed"):
+            compact["winning_choice"] = choices[winner] if winner < len(choices) else winner
+        compact["winning_share"] = round(float(scores[winner]) / total, 3)
+    compact["votes"] = round(float(total)) if total >= 100 else round(float(total), 2)
+    if proposal.get("start") and proposal.get("end"):
+        compact["duration_days"] = round((proposal["end"] - proposal["start"]) / 86400, 2)
+    return compact
+
+
+def stats_cache_key(dao_data: Dict[str, Any]) -> str:
+    """Key statistics by space id, data profile and a hash of the proposals' ids, states and vote totals."""
+    proposal_votes = sorted(
+        (proposal["id"], proposal.get("state"), proposal.get("scores_total")) for proposal in dao_data["proposals"]
+    )
+    digest = hashlib.sha256(json.dumps(proposal_votes).encode("utf-8")).hexdigest()
+    return f"{dao_data['space']['id']}:{dao_data.get('profile', 'full')}:{digest}"
+
+
+def get_governance_stats(dao_data: Dict[str, Any]) -> Dict[str, Any]:
+    """Return the cached statistics for this space and proposal set, computing them on a miss."""
+    cache_key = stats_cache_key(dao_data)
+    stats = governance_stats_cache.get(cache_key)
+    if stats is None:
+        stats = compute_governance_stats(dao_data["proposals"])
+        governance_stats_cache.set(cache_key, stats)
+    return stats
+
+
+governance_stats_cache = TTLCache(max_entries=GOVERNANCE_STATS_CACHE_SIZE, ttl=GOVERNANCE_STATS_CACHE_TTL)
@@ -0,0 +1,395 @@
+"""
+Job queue for DAO proposal optimizations.
+
+Jobs are persisted in a local SQLite database and run by a pool of worker
+threads, so an optimization keeps running when the Streamlit script that
+asked for it is rerun or its page is refreshed, and the number of workers
+is independent of the number of UI sessions. The app records each session's
+running job in the session store: a rerun, or a refreshed page whose session
+is restored (SESSION_URL_RESTORE), adds the job's result to the chat once it
+is done. A refreshed page without session restore starts a new conversation.
+
+The Streamlit app hosts a pool of JOB_WORKERS workers. More workers can run
+as separate processes on the same database:
+
+    python jobs.py --workers 8
+
+API keys are never written to the database. Jobs submitted with the
+default OPENAI_API_KEY can run in any worker process; jobs submitted with a
+user-supplied key run in the process that accepted them.
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import sqlite3
+import argparse
+import threading
+import contextvars
+from typing import Dict, Any, Callable, List, Optional, Tuple
+from dotenv import load_dotenv
+
+# Load environment variables from .env file
+load_dotenv()
+
+from optimizer import run_optimizer, OptimizerError  # noqa: E402
+
+JOB_DB_PATH = os.environ.get("JOB_DB_PATH", "deo_jobs.sqlite3")
+# Worker threads in each process hosting a job service
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", 4))
+# A running job whose worker has not checked in for this long is queued again
+JOB_STALE_AFTER = int(os.environ.get("JOB_STALE_AFTER", 120))
+# Finished jobs are deleted after this many seconds
+JOB_RETENTION = int(os.environ.get("JOB_RETENTION", 7 * 24 * 60 * 60))
+# Seconds between writes of a running job's partial output to the database
+JOB_PARTIAL_FLUSH_INTERVAL = 1.0
+# Seconds between check-ins of the jobs a process is running, well within JOB_STALE_AFTER
+JOB_HEARTBEAT_INTERVAL = JOB_STALE_AFTER / 4
+
+FINISHED_STATES = ("done", "failed")
+
+
+class JobStore:
+    """SQLite persistence for jobs; safe to share between threads and processes."""
+
+    def __init__(self, path: str = JOB_DB_PATH):
+        self.path = path
+        with self._connect() as connection:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    status TEXT NOT NULL,
+                    dao_name TEXT NOT NULL,
+                    initial_proposal TEXT NOT NULL,
+                    num_proposals INTEGER NOT NULL,
+                    uses_default_key INTEGER NOT NULL,
+                    partial TEXT NOT NULL DEFAULT '',
+                    result TEXT,
+                    error TEXT,
+                    worker TEXT,
+                    created_at REAL NOT NULL,
+                    started_at REAL,
+                    heartbeat_at REAL,
+                    finished_at REAL
+                )
+            """)
+            connection.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at)")
+
+    def _connect(self) -> sqlite3.Connection:
+        connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        connection.row_factory = sqlite3.Row
+        return connection
+
+    def create(self, dao_name: str, initial_proposal: str, num_proposals: int, uses_default_key: bool) -> str:
+        job_id = uuid.uuid4().hex
+        with self._connect() as connection:
+            connection.execute(
+                "INSERT INTO jobs (id, status, dao_name, initial_proposal, num_proposals, uses_default_key, created_at) "
+                "VALUES (?, 'queued', ?, ?, ?, ?, ?)",
+                (job_id, dao_name, initial_proposal, num_proposals, int(uses_default_key), time.time())
+            )
+        return job_id
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._connect() as connection:
+            row = connection.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+
+        job = dict(row)
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        return job
+
+    def claim(self, worker: str, held_job_ids: List[str]) -> Optional[Dict[str, Any]]:
+        """
+        Mark the oldest queued job this worker can run as running by `worker`
+        and return it. `worker` must be unique to this run of the job: a run
+        whose job was queued again and claimed by another can no longer write
+        to it.
+        """
+        placeholders = ",".join("?" for _ in held_job_ids) or "NULL"
+        connection = self._connect()
+        try:
+            connection.execute("BEGIN IMMEDIATE")
+            now = time.time()
+            # Jobs whose worker died mid-run go back in the queue
+            connection.execute(
+                "UPDATE jobs SET status = 'queued', worker = NULL "
+                "WHERE status = 'running' AND heartbeat_at < ?",
+                (now - JOB_STALE_AFTER,)
+            )
+            row = connection.execute(
+                f"SELECT id FROM jobs WHERE status = 'queued' "
+                f"AND (uses_default_key = 1 OR id IN ({placeholders})) "
+                f"ORDER BY created_at LIMIT 1",
+                held_job_ids
+            ).fetchone()
+            if row is not None:
+                connection.execute(
+                    "UPDATE jobs SET status = 'running', worker = ?, partial = '', "
+                    "started_at = ?, heartbeat_at = ? WHERE id = ?",
+                    (worker, now, now, row["id"])
+                )
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+        finally:
+            connection.close()
+
+        return self.get(row["id"]) if row is not None else None
+
+    def heartbeat(self, workers: List[str]) -> None:
+        """Record that the runs claimed as `workers` are still alive."""
+        placeholders = ",".join("?" for _ in workers)
+        with self._connect() as connection:
+            connection.execute(
+                f"UPDATE jobs SET heartbeat_at = ? WHERE status = 'running' AND worker IN ({placeholders})",
+                (time.time(), *workers)
+            )
+
+    def update_partial(self, job_id: str, worker: str, partial: str) -> None:
+        with self._connect() as connection:
+            connection.execute(
+                "UPDATE jobs SET partial = ?, heartbeat_at = ? WHERE id = ? AND status = 'running' AND worker = ?",
+                (partial, time.time(), job_id, worker)
+            )
+
+    def finish(self, job_id: str, worker: str, result: Optional[Dict[str, Any]] = None,
+               error: Optional[str] = None) -> None:
+        with self._connect() as connection:
+            connection.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, finished_at = ? "
+                "WHERE id = ? AND status = 'running' AND worker = ?",
+                ("failed" if error else "done", json.dumps(result) if result else None, error, time.time(),
+                 job_id, worker)
+            )
+
+    def fail_orphaned(self, error: str) -> None:
+        """Fail queued jobs that need an API key no running process holds any more."""
+        with self._connect() as connection:
+            connection.execute(
+                "UPDATE jobs SET status = 'failed', error = ?, finished_at = ? "
+                "WHERE status = 'queued' AND uses_default_key = 0 AND created_at < ?",
+                (error, time.time(), time.time() - JOB_STALE_AFTER)
+            )
+
+    def popular_daos(self, since: float, limit: int) -> List[Tuple[str, int]]:
+        """
+        The `limit` DAO names most often submitted since `since`, most popular
+        first, each with the largest number of proposals asked for.
+        """
+        with self._connect() as connection:
+            rows = connection.execute(
+                "SELECT MIN(dao_name), MAX(num_proposals) FROM jobs WHERE created_at >= ? "
+                "GROUP BY LOWER(TRIM(dao_name)) ORDER BY COUNT(*) DESC LIMIT ?",
+                (since, limit)
+            ).fetchall()
+        return [(row[0], row[1]) for row in rows]
+
+    def delete_finished_before(self, timestamp: float) -> None:
+        with self._connect() as connection:
+            connection.execute(
+                "DELETE FROM jobs WHERE status IN ('done', 'failed') AND finished_at < ?", (timestamp,)
+            )
+
+
+class JobService:
+    """
+    Accepts optimization jobs and runs them on a pool of worker threads.
+
+    Running jobs' optimized proposal tokens are kept in memory for `wait` and
+    written to the store every JOB_PARTIAL_FLUSH_INTERVAL seconds for pollers
+    in other sessions or processes. A heartbeat thread checks the running jobs
+    in every JOB_HEARTBEAT_INTERVAL seconds, however long their stages take.
+    """
+
+    def __init__(self, store: JobStore, workers: int = JOB_WORKERS, default_api_key: Optional[str] = None):
+        self.store = store
+        self.workers = workers
+        self.default_api_key = default_api_key or os.environ.get("OPENAI_API_KEY")
+        self.worker_id = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self._api_keys: Dict[str, str] = {}
+        # Submitters' contexts, so a job's stages record into the submitting request's trace
+        self._contexts: Dict[str, contextvars.Context] = {}
+        self._partials: Dict[str, List[str]] = {}
+        # Job id -> the worker id its current run in this process claimed it as
+        self._runs: Dict[str, str] = {}
+        self._condition = threading.Condition()
+        self._stopping = threading.Event()
+        self._threads: List[threading.Thread] = []
+
+    def start(self) -> "JobService":
+        self.store.delete_finished_before(time.time() - JOB_RETENTION)
+        self.store.fail_orphaned("The API key for this job is no longer available; please submit it again.")
+        for number in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f"deo-job-worker-{number}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        thread = threading.Thread(target=self._heartbeat, name="deo-job-heartbeat", daemon=True)
+        thread.start()
+        self._threads.append(thread)
+        return self
+
+    def stop(self) -> None:
+        self._stopping.set()
+        with self._condition:
+            self._condition.notify_all()
+
+    def submit(self, dao_name: str, initial_proposal: str, num_proposals: int, api_key: str) -> str:
+        """Queue an optimization and return its job id."""
+        uses_default_key = bool(self.default_api_key) and api_key == self.default_api_key
+        job_id = self.store.create(dao_name, initial_proposal, num_proposals, uses_default_key)
+        with self._condition:
+            if not uses_default_key:
+                self._api_keys[job_id] = api_key
+            self._contexts[job_id] = contextvars.copy_context()
+            self._condition.notify_all()
+        return job_id
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Return the job's current record, with the freshest partial output this process has."""
+        job = self.store.get(job_id)
+        if job is not None and job["status"] == "running":
+            with self._condition:
+                if job_id in self._partials:
+                    job["partial"] = "".join(self._partials[job_id])
+        return job
+
+    def wait(self, job_id: str, on_token: Optional[Callable[[str], None]] = None,
+             poll_interval: float = 1.0) -> Dict[str, Any]:
+        """
+        Block until the job has finished, passing its optimized proposal tokens to `on_token`.
+
+        While this process runs the job its tokens arrive in memory, so the
+        store is read when that run ends and otherwise at most once every
+        `poll_interval` seconds, however often other jobs wake this waiter.
+        """
+        forwarded = 0
+        running_here = False
+        last_read = None
+        while True:
+            with self._condition:
+                partial = self._partials.get(job_id)
+                if last_read is not None and (partial is None or len(partial) == forwarded):
+                    self._condition.wait(timeout=max(0.0, last_read + poll_interval - time.monotonic()))
+                    partial = self._partials.get(job_id)
+                new_tokens = partial[forwarded:] if partial is not None else []
+                forwarded += len(new_tokens)
+                run_ended = running_here and partial is None
+                running_here = partial is not None
+
+            if on_token is not None:
+                for token in new_tokens:
+                    on_token(token)
+
+            if not run_ended and last_read is not None and time.monotonic() - last_read < poll_interval:
+                continue
+            last_read = time.monotonic()
+            job = self.store.get(job_id)
+            if job is None or job["status"] in FINISHED_STATES:
+                with self._condition:
+                    self._contexts.pop(job_id, None)
+                return job
+
+    def _work(self) -> None:
+        while not self._stopping.is_set():
+            with self._condition:
+                held_job_ids = list(self._api_keys)
+            job = self.store.claim(f"{self.worker_id}-{uuid.uuid4().hex[:8]}", held_job_ids)
+            if job is None:
+                # Also picks up jobs queued by other processes
+                with self._condition:
+                    self._condition.wait(timeout=1.0)
+                continue
+            self._run(job)
+
+    def _heartbeat(self) -> None:
+        while not self._stopping.wait(JOB_HEARTBEAT_INTERVAL):
+            with self._condition:
+                workers = list(self._runs.values())
+            if not workers:
+                continue
+            try:
+                self.store.heartbeat(workers)
+            except sqlite3.Error:
+                # Try again on the next beat; a job only goes stale after several missed ones
+                pass
+
+    def _run(self, job: Dict[str, Any]) -> None:
+        job_id, worker = job["id"], job["worker"]
+        tokens: List[str] = []
+        with self._condition:
+            api_key = self._api_keys.pop(job_id, None) or self.default_api_key
+            context = self._contexts.pop(job_id, None) or contextvars.Context()
+            self._partials[job_id] = tokens
+            self._runs[job_id] = worker
+        last_flush = time.monotonic()
+
+        def stream_writer(chunk: Dict[str, str]) -> None:
+            nonlocal last_flush
+            token = chunk.get("optimized_proposal_token")
+            if not token:
+                return
+            with self._condition:
+                # Each run appends to its own list, so a superseded run cannot mix into the current one
+                tokens.append(token)
+                self._condition.notify_all()
+            if time.monotonic() - last_flush >= JOB_PARTIAL_FLUSH_INTERVAL:
+                last_flush = time.monotonic()
+                with self._condition:
+                    partial = "".join(tokens)
+                self.store.update_partial(job_id, worker, partial)
+
+        try:
+            result = context.run(
+                run_optimizer, job["dao_name"], job["initial_proposal"], job["num_proposals"], api_key, stream_writer
+            )
+            self.store.finish(job_id, worker, result=result)
+        except OptimizerError as e:
+            self.store.finish(job_id, worker, error=str(e))
+        except Exception as e:
+            self.store.finish(job_id, worker, error=f"Error in proposal optimization process: {str(e)}")
+        finally:
+            with self._condition:
+                if self._runs.get(job_id) == worker:
+                    self._partials.pop(job_id, None)
+                    self._runs.pop(job_id, None)
+                self._condition.notify_all()
+
+
+_job_service: Optional[JobService] = None
+_job_service_lock = threading.Lock()
+
+
+def get_job_service() -> JobService:
+    """Return this process's job service, starting its workers on first use."""
+    global _job_service
+    if _job_service is None:
+        with _job_service_lock:
+            if _job_service is None:
+                _job_service = JobService(JobStore()).start()
+    return _job_service
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=JOB_WORKERS, help="worker threads in this process")
+    args = parser.parse_args()
+
+    if not os.environ.get("OPENAI_API_KEY"):
+        parser.error("OPENAI_API_KEY must be set in the environment or .env file")
+
+    service = JobService(JobStore(), workers=args.workers).start()
+    print(f"{args.workers} workers processing jobs from {JOB_DB_PATH}", file=sys.stderr)
+    try:
+        while True:
+            time.sleep(60)
+    except KeyboardInterrupt:
+        service.stop()
+
+
+if __name__ == "__main__":
+    main()
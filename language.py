@@ -0,0 +1,87 @@
+"""
+Offline check for proposals that are already in English.
+
+The optimizer only needs the translation LLM call for non-English
+proposals. `is_confidently_english` decides from script and stopword
+statistics, erring towards "not sure" (and so translating) whenever the
+text is short, uses non-ASCII letters, or reads like another European
+language.
+"""
+import re
+import threading
+
+# Fewer words than this is too little evidence, so the text is translated
+MIN_WORDS = 12
+# Share of letters allowed outside ASCII (names, quotes, the odd accented word)
+MAX_NON_ASCII_LETTERS = 0.02
+# Share of words that must be common English function words; English prose is usually 40-50%
+MIN_ENGLISH_STOPWORDS = 0.25
+
+ENGLISH_STOPWORDS = frozenset("""
+a about above after again against all am an and any are as at be because been before being below
+between both but by can could did do does doing down during each few for from further had has have
+having he her here hers herself him himself his how i if in into is it its itself just me more most
+my myself no nor not now of off on once only or other our ours ourselves out over own same she
+should so some such than that the their theirs them themselves then there these they this those
+through to too under until up very was we were what when where which while who whom why will with
+would you your yours yourself yourselves also
+""".split())
+
+# Function words of the languages most often confused with English at the word level
+OTHER_STOPWORDS = {
+    "es": frozenset("el la los las de del que y en un una por con para es se su al lo como más pero sus".split()),
+    "fr": frozenset("le la les de des du que et en un une pour dans est sur au aux par pas qui avec ce".split()),
+    "de": frozenset("der die das und den von zu mit ist des dem nicht ein eine für auf im sich auch wir".split()),
+    "pt": frozenset("o a os as de do da dos das que e em um uma para com não por se na no ao mais".split()),
+    "it": frozenset("il lo la gli le di del della che e in un una per con non sono è si al dei".split()),
+    "nl": frozenset("de het een van en in is dat op te zijn met voor niet aan er ook als bij".split()),
+}
+
+_URL = re.compile(r"https?://\S+|www\.\S+|0x[0-9a-fA-F]+")
+_WORD = re.compile(r"[^\W\d_]+(?:'[^\W\d_]+)?")
+
+
+def is_confidently_english(text: str) -> bool:
+    """True when `text` is English beyond reasonable doubt; False when unsure or not English."""
+    text = _URL.sub(" ", text or "")
+
+    letters = [char for char in text if char.isalpha()]
+    if not letters:
+        return False
+    non_ascii = sum(1 for char in letters if not char.isascii())
+    if non_ascii / len(letters) > MAX_NON_ASCII_LETTERS:
+        return False
+
+    words = [word.lower() for word in _WORD.findall(text)]
+    if len(words) < MIN_WORDS:
+        return False
+
+    english_share = sum(1 for word in words if word in ENGLISH_STOPWORDS) / len(words)
+    if english_share < MIN_ENGLISH_STOPWORDS:
+        return False
+
+    # Short words such as "a", "de" or "no" are shared, so English must clearly dominate
+    other_share = max(
+        sum(1 for word in words if word in stopwords and word not in ENGLISH_STOPWORDS) / len(words)
+        for stopwords in OTHER_STOPWORDS.values()
+    )
+    return other_share * 4 < english_share
+
+
+class FastPathCounter:
+    """Thread-safe count of proposals that skipped (hits) or needed (misses) the translation call."""
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def record(self, hit: bool) -> None:
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+
+english_fast_path = FastPathCounter()
@@ -0,0 +1,348 @@
+"""
+OpenAI access shared by every stage: per-key clients, rate-limit scheduling
+and retries, and the chat agent.
+
+The OpenAI SDK is only imported when the first request is made, and the
+LangChain agent stack (see agent.py) when a chat prompt first needs the
+agent, so neither slows down the app's start-up.
+"""
+import os
+import re
+import json
+import time
+import random
+import hashlib
+import threading
+from collections import deque
+from typing import TYPE_CHECKING, Any, Dict, List, Optional
+from cache import TTLCache
+from telemetry import record, record_usage
+
+if TYPE_CHECKING:
+    from openai import OpenAI
+
+# Rough average for English text and JSON with gpt-4o family tokenizers
+CHARS_PER_TOKEN = 4
+
+AGENT_MODEL = "gpt-4o-mini"
+
+EMBEDDING_MODEL = "text-embedding-3-small"
+# Texts sent per embeddings request
+EMBEDDING_BATCH_SIZE = 256
+
+# API keys whose clients, chat model and compiled agent are kept, and for how long
+LLM_CLIENT_CACHE_SIZE = int(os.environ.get("LLM_CLIENT_CACHE_SIZE", 32))
+LLM_CLIENT_CACHE_TTL = int(os.environ.get("LLM_CLIENT_CACHE_TTL", 60 * 60))
+
+# Starting per-key, per-model budgets; replaced by the limits OpenAI reports in its response headers
+LLM_REQUESTS_PER_MINUTE = int(os.environ.get("LLM_REQUESTS_PER_MINUTE", 500))
+LLM_TOKENS_PER_MINUTE = int(os.environ.get("LLM_TOKENS_PER_MINUTE", 200000))
+# Completion tokens counted against the budget when a request sets no max_tokens
+LLM_EXPECTED_COMPLETION_TOKENS = int(os.environ.get("LLM_EXPECTED_COMPLETION_TOKENS", 1000))
+# Tokens counted for each agent (chat model) request, whose prompt is not visible to the scheduler
+LLM_AGENT_REQUEST_TOKENS = int(os.environ.get("LLM_AGENT_REQUEST_TOKENS", 4000))
+# Times a request rejected with 429 (or failing with a 5xx or connection error) is retried
+LLM_RATE_LIMIT_RETRIES = int(os.environ.get("LLM_RATE_LIMIT_RETRIES", 5))
+LLM_MAX_BACKOFF = float(os.environ.get("LLM_MAX_BACKOFF", 60))
+
+
+def estimate_tokens(content: Any) -> int:
+    """Cheap, dependency-free estimate of the prompt tokens `content` will use."""
+    if not isinstance(content, str):
+        content = json.dumps(content)
+    return len(content) // CHARS_PER_TOKEN + 1
+
+
+def estimate_request_tokens(body: Dict[str, Any]) -> int:
+    """Tokens an OpenAI request counts against the tokens-per-minute budget: prompt plus completion."""
+    if "messages" in body:
+        prompt = "".join(
+            message["content"] if isinstance(message.get("content"), str) else json.dumps(message.get("content"))
+            for message in body["messages"]
+        )
+    else:
+        prompt = body.get("input") or ""
+    completion = body.get("max_completion_tokens") or body.get("max_tokens")
+    if completion is None:
+        completion = LLM_EXPECTED_COMPLETION_TOKENS if "messages" in body else 0
+    return estimate_tokens(prompt) + completion
+
+
+def parse_reset_duration(value: Optional[str]) -> Optional[float]:
+    """Parse OpenAI reset durations such as '1s', '250ms' or '6m0s' into seconds."""
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+
+    units = {"h": 3600, "m": 60, "s": 1, "ms": 0.001}
+    parts = re.findall(r"([0-9.]+)(ms|h|m|s)", value)
+    if not parts:
+        return None
+    return sum(float(amount) * units[unit] for amount, unit in parts)
+
+
+class RateLimitScheduler:
+    """
+    Paces the OpenAI requests made with one API key to one model.
+
+    Keeps a sliding one-minute window of the requests and estimated tokens
+    already sent and makes callers wait, first come first served, until their
+    request fits within both the requests-per-minute and tokens-per-minute
+    budgets. The budgets follow the limits OpenAI reports in its
+    x-ratelimit-* headers, and a 429 pauses the whole queue for the time the
+    server asks for. OpenAI sets these limits per model, so each model used
+    with a key gets its own scheduler.
+    """
+
+    WINDOW = 60.0
+
+    def __init__(self, requests_per_minute: int = LLM_REQUESTS_PER_MINUTE,
+                 tokens_per_minute: int = LLM_TOKENS_PER_MINUTE):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.waits = 0
+        self.rate_limited = 0
+        self._sent: deque = deque()
+        self._tokens_in_window = 0
+        self._paused_until = 0.0
+        self._next_ticket = 0
+        self._serving = 0
+        self._abandoned = set()
+        self._condition = threading.Condition()
+
+    def acquire(self, tokens: int, blocking: bool = True) -> bool:
+        """
+        Wait until a request of `tokens` estimated tokens may be sent and count
+        it. Without `blocking`, only count it if it may be sent right away.
+        """
+        with self._condition:
+            if not blocking:
+                if self._next_ticket != self._serving or self._delay(self._serving, tokens) > 0:
+                    return False
+            ticket = self._next_ticket
+            self._next_ticket += 1
+            try:
+                delay = self._delay(ticket, tokens)
+                if delay > 0:
+                    self.waits += 1
+                while delay > 0:
+                    self._condition.wait(timeout=delay)
+                    delay = self._delay(ticket, tokens)
+
+                self._sent.append((time.monotonic(), tokens))
+                self._tokens_in_window += tokens
+                return True
+            finally:
+                # Let the next caller in line go, also if this one was interrupted while waiting
+                if ticket == self._serving:
+                    self._serving += 1
+                    while self._serving in self._abandoned:
+                        self._abandoned.remove(self._serving)
+                        self._serving += 1
+                else:
+                    self._abandoned.add(ticket)
+                self._condition.notify_all()
+
+    def pause(self, seconds: float) -> None:
+        """Hold every queued request for `seconds` after the server rejected one."""
+        with self._condition:
+            self.rate_limited += 1
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    def update_limits(self, headers) -> None:
+        """Adopt the per-minute limits OpenAI reports for this key."""
+        with self._condition:
+            try:
+                if headers.get("x-ratelimit-limit-requests"):
+                    self.requests_per_minute = int(headers["x-ratelimit-limit-requests"])
+                if headers.get("x-ratelimit-limit-tokens"):
+                    self.tokens_per_minute = int(headers["x-ratelimit-limit-tokens"])
+            except ValueError:
+                pass
+
+    def _delay(self, ticket: int, tokens: int) -> float:
+        # Seconds until `ticket` may send; at most one second so waiters recheck the queue
+        if ticket != self._serving:
+            return 1.0
+
+        now = time.monotonic()
+        while self._sent and now - self._sent[0][0] >= self.WINDOW:
+            self._tokens_in_window -= self._sent.popleft()[1]
+
+        if self._paused_until > now:
+            return min(self._paused_until - now, 1.0)
+        if len(self._sent) >= self.requests_per_minute:
+            return self._sent[0][0] + self.WINDOW - now
+        # A single request larger than the whole budget is sent once the window is empty
+        if self._sent and self._tokens_in_window + tokens > self.tokens_per_minute:
+            return self._sent[0][0] + self.WINDOW - now
+        return 0.0
+
+
+def retry_delay(headers, attempt: int) -> float:
+    """Seconds to wait before retrying, from the Retry-After or x-ratelimit-reset-* headers."""
+    headers = headers or {}
+    delay = None
+    if headers.get("retry-after-ms"):
+        delay = parse_reset_duration(headers["retry-after-ms"])
+        delay = delay / 1000 if delay is not None else None
+    if delay is None:
+        delay = parse_reset_duration(headers.get("retry-after"))
+    if delay is None:
+        resets = [
+            parse_reset_duration(headers.get("x-ratelimit-reset-requests")),
+            parse_reset_duration(headers.get("x-ratelimit-reset-tokens"))
+        ]
+        resets = [reset for reset in resets if reset is not None]
+        delay = max(resets) if resets else None
+    if delay is None:
+        delay = (2 ** attempt) + random.uniform(0, 1)
+    return min(delay, LLM_MAX_BACKOFF)
+
+
+class _KeyResources:
+    """Everything built for one API key: its per-model schedulers, OpenAI client, chat model and agents."""
+
+    def __init__(self, api_key: str):
+        from openai import OpenAI
+
+        self.api_key = api_key
+        self.schedulers: Dict[str, RateLimitScheduler] = {}
+        # Retries happen in chat_completion so they wait in the scheduler's queue
+        self.openai_client = OpenAI(api_key=api_key, max_retries=0)
+        self.agents: Dict[str, Any] = {}
+        self._chat_model = None
+        self._lock = threading.Lock()
+
+    def scheduler(self, model: str) -> RateLimitScheduler:
+        with self._lock:
+            if model not in self.schedulers:
+                self.schedulers[model] = RateLimitScheduler()
+            return self.schedulers[model]
+
+    @property
+    def chat_model(self):
+        # Built on first use, so processes that never run the chat agent never import LangChain
+        if self._chat_model is None:
+            scheduler = self.scheduler(AGENT_MODEL)
+            with self._lock:
+                if self._chat_model is None:
+                    from agent import build_chat_model
+                    self._chat_model = build_chat_model(self.api_key, scheduler)
+        return self._chat_model
+
+
+def _key_id(api_key: str) -> str:
+    # Cache keys never contain the API key itself
+    return hashlib.sha256((api_key or "").encode("utf-8")).hexdigest()
+
+
+def _resources(api_key: str) -> _KeyResources:
+    cache_key = _key_id(api_key)
+    resources = _key_resources.get(cache_key)
+    if resources is None:
+        with _key_resources_lock:
+            resources = _key_resources.get(cache_key)
+            if resources is None:
+                resources = _KeyResources(api_key)
+                _key_resources.set(cache_key, resources)
+    return resources
+
+
+def get_openai_client(api_key: str) -> "OpenAI":
+    """Return the shared OpenAI client (and its connection pool) for `api_key`."""
+    return _resources(api_key).openai_client
+
+
+def _create(resources: _KeyResources, create, kwargs: Dict[str, Any]):
+    # Send `create(**kwargs)` once the scheduler of the key and model lets it through. 429s pause
+    # that whole queue for as long as the server asks; 5xx and connection errors are retried with backoff
+    import openai
+
+    scheduler = resources.scheduler(kwargs["model"])
+    tokens = estimate_request_tokens(kwargs)
+    attempt = 0
+    while True:
+        scheduler.acquire(tokens)
+        try:
+            raw_response = create(**kwargs)
+        except openai.RateLimitError as e:
+            # Out of credits is also a 429, but waiting won't help
+            if attempt >= LLM_RATE_LIMIT_RETRIES or "insufficient_quota" in str(e):
+                raise
+            scheduler.pause(retry_delay(e.response.headers, attempt))
+        except (openai.InternalServerError, openai.APIConnectionError) as e:
+            if attempt >= LLM_RATE_LIMIT_RETRIES:
+                raise
+            time.sleep(retry_delay(getattr(getattr(e, "response", None), "headers", None), attempt))
+        else:
+            scheduler.update_limits(raw_response.headers)
+            record(llm_requests=1, http_bytes=int(raw_response.headers.get("content-length") or 0))
+            return raw_response.parse()
+        attempt += 1
+
+
+def chat_completion(api_key: str, **kwargs):
+    """
+    Create a chat completion with `api_key`'s shared client once the
+    rate-limit scheduler of the key and model lets the request through. 429s
+    pause that whole queue for as long as the server asks; 5xx and connection
+    errors are retried with backoff.
+    """
+    resources = _resources(api_key)
+    if kwargs.get("stream"):
+        # Streams only report token usage when asked to, in a final chunk
+        kwargs.setdefault("stream_options", {"include_usage": True})
+    response = _create(resources, resources.openai_client.chat.completions.with_raw_response.create, kwargs)
+    if kwargs.get("stream"):
+        return _recording_usage(response)
+    record_usage(response.usage)
+    return response
+
+
+def embed_texts(api_key: str, texts: List[str]) -> List[List[float]]:
+    """Embed `texts` with EMBEDDING_MODEL, in batches queued on `api_key`'s scheduler for that model."""
+    resources = _resources(api_key)
+    embeddings = []
+    for start in range(0, len(texts), EMBEDDING_BATCH_SIZE):
+        response = _create(resources, resources.openai_client.embeddings.with_raw_response.create, {
+            "model": EMBEDDING_MODEL,
+            "input": texts[start:start + EMBEDDING_BATCH_SIZE]
+        })
+        record_usage(response.usage)
+        embeddings.extend(item.embedding for item in sorted(response.data, key=lambda item: item.index))
+    return embeddings
+
+
+def _recording_usage(stream):
+    for chunk in stream:
+        record_usage(getattr(chunk, "usage", None))
+        yield chunk
+
+
+def get_chat_model(api_key: str):
+    """Return the shared, rate-limited LangChain chat model for `api_key`."""
+    return _resources(api_key).chat_model
+
+
+def get_rate_limit_scheduler(api_key: str, model: str = AGENT_MODEL) -> RateLimitScheduler:
+    """Return the scheduler every OpenAI request made with `api_key` to `model` waits on."""
+    return _resources(api_key).scheduler(model)
+
+
+def get_agent(api_key: str, tools: List[Any]):
+    """Return the compiled ReAct agent for `api_key` and `tools`, compiling it on first use."""
+    from agent import build_agent
+
+    resources = _resources(api_key)
+    agent_key = ",".join(tool.name for tool in tools)
+    if agent_key not in resources.agents:
+        resources.agents[agent_key] = build_agent(resources.chat_model, tools)
+    return resources.agents[agent_key]
+
+
+_key_resources = TTLCache(max_entries=LLM_CLIENT_CACHE_SIZE, ttl=LLM_CLIENT_CACHE_TTL)
+_key_resources_lock = threading.Lock()
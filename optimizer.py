@@ -0,0 +1,228 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, Callable, Optional
+from snapshot import space_directory, proposal_store, proposal_flights, prune_dao_data
+from analysis import get_dao_analysis
+from llm import chat_completion
+from telemetry import traced, in_current_context
+from language import is_confidently_english, english_fast_path
+from retrieval import proposal_index, retrieval_pool_size, select_proposals
+
+
+class OptimizerError(Exception):
+    """Raised when a stage of the DAO proposal optimization fails."""
+
+
+# Internal function: Get Space ID by fuzzy matching DAO name
+@traced
+def get_space_id(dao_name: str) -> str:
+    try:
+        # Served from the process-wide space directory and its trigram name index
+        # instead of crawling Snapshot and scoring every space on every call
+        best_match = space_directory.best_match(dao_name)
+        
+        if best_match is None:
+            raise OptimizerError("No spaces found on Snapshot")
+        
+        if best_match and best_match[0] > 0.6:
+            return best_match[1]
+        else:
+            raise OptimizerError(f"DAO '{dao_name}' not found on Snapshot platform")
+            
+    except OptimizerError:
+        raise
+    except Exception as e:
+        raise OptimizerError(f"Error finding DAO space: {str(e)}")
+
+
+# Internal function: Get DAO data from Snapshot
+@traced
+def get_dao_data(space_id: str, num_proposals: int) -> Dict[str, Any]:
+    if space_id.startswith("'") and space_id.endswith("'"):
+        space_id = space_id[1:-1]
+
+    try:
+        # Only proposals created or still open since the last request for this space are fetched,
+        # and address lists, plugins and long bodies are pruned before they reach the prompt.
+        # Concurrent requests for the same space and number of proposals share one fetch
+        return proposal_flights.do(
+            f"{space_id}:{num_proposals}", lambda: prune_dao_data(proposal_store.get(space_id, num_proposals))
+        )
+        
+    except Exception as e:
+        raise OptimizerError(f"Error fetching DAO data: {str(e)}")
+
+
+# Internal function: Narrow DAO data to the proposals most relevant to the user's proposal
+@traced
+def select_relevant_proposals(dao_data: Dict[str, Any], english_proposal: str, num_proposals: int,
+                              api_key: str) -> Dict[str, Any]:
+    try:
+        # The most recent proposals plus the past proposals most similar to this one
+        return select_proposals(dao_data, english_proposal, num_proposals, api_key)
+
+    except Exception:
+        # Retrieval only makes the analysis more relevant, so fall back to the most recent proposals
+        return {**dao_data, "proposals": dao_data["proposals"][:num_proposals]}
+
+
+# Internal function: Analyze DAO data from Snapshot
+@traced
+def analyze_dao_data(dao_data: Dict[str, Any], api_key: str) -> str:
+    try:                
+        # Reuses the analysis of the same proposal set from any session; large proposal
+        # histories are analyzed in concurrent batches and then merged
+        return get_dao_analysis(dao_data, api_key)
+        
+    except Exception as e:
+        raise OptimizerError(f"Error analyzing DAO data: {str(e)}")
+
+
+# Internal function: Translate proposal to English
+@traced
+def translate_proposal(initial_proposal: str, api_key: str) -> str:
+    # Proposals that are clearly English already are passed through without an LLM round trip
+    if is_confidently_english(initial_proposal):
+        english_fast_path.record(hit=True)
+        return initial_proposal
+    english_fast_path.record(hit=False)
+
+    translation_prompt = f"""
+    Detect the language of this text and if it's not English, translate it to English. 
+    If this text is in English, then output the exact same text word for word:
+    {initial_proposal}
+    """
+    translation_response = chat_completion(
+        api_key,
+        model="gpt-4o-mini",
+        messages=[
+            {"role": "system", "content": "You are a language detection and translation expert."},
+            {"role": "user", "content": translation_prompt}
+        ]
+    )
+    return translation_response.choices[0].message.content
+
+
+# Internal function: Optimize proposal
+@traced
+def optimize_proposal(english_proposal: str, dao_data_analysis: str, api_key: str,
+                      stream_writer: Optional[Callable[[Dict[str, str]], None]] = None) -> str:
+    try:
+        optimize_prompt = f"""
+        As a DAO governance proposal optimization expert, optimize the initial proposal below based on the DAO data analysis obtained from the DAO platform Snapshot to obtain a higher passing rate.
+
+        Initial Proposal:
+        {english_proposal}
+        
+        DAO Data Analysis:
+        {dao_data_analysis}
+
+        In addition, for the optimized proposal use clear, professional language that balances technical and non-technical understanding.
+
+        Output:
+        1. An optimized version of the initial proposal based on the DAO data analysis
+        2. A bullet-point list of all changes and recommendations made
+
+        Keep the output focused only on the optimized proposal and the list of changes/recommendations. Do not output anything else.
+        """
+        
+        optimization_stream = chat_completion(
+            api_key,
+            model="gpt-4o-mini",
+            messages=[
+                {"role": "system", "content": "You are an expert in DAO (decentralized autonomous organization) governance and proposal optimization."},
+                {"role": "user", "content": optimize_prompt}
+            ],
+            stream=True
+        )
+        
+        optimized_parts = []
+        for chunk in optimization_stream:
+            if not chunk.choices or not chunk.choices[0].delta.content:
+                continue
+            token = chunk.choices[0].delta.content
+            optimized_parts.append(token)
+            if stream_writer is not None:
+                stream_writer({"optimized_proposal_token": token})
+        
+        return "".join(optimized_parts)
+        
+    except Exception as e:
+        raise OptimizerError(f"Error optimizing proposal: {str(e)}")
+
+
+def prepare_dao_data(dao_name: str, num_proposals: int, api_key: str) -> Dict[str, Any]:
+    """
+    Resolve the DAO, fetch the recent proposals its analysis input is picked
+    from and embed the ones not indexed yet (the Snapshot branch of the pipeline).
+    """
+    space_id = get_space_id(dao_name)
+    return {"space_id": space_id, "dao_data": prepare_space_data(space_id, num_proposals, api_key)}
+
+
+def prepare_space_data(space_id: str, num_proposals: int, api_key: str) -> Dict[str, Any]:
+    """`prepare_dao_data` for an already resolved space id; returns its DAO data."""
+    dao_data = get_dao_data(space_id, retrieval_pool_size(num_proposals))
+    if len(dao_data["proposals"]) > num_proposals:
+        try:
+            proposal_index.update(space_id, dao_data["proposals"], api_key)
+        except Exception:
+            # select_relevant_proposals retries, or falls back to the most recent proposals
+            pass
+    return dao_data
+
+
+@traced
+def run_optimizer(dao_name: str, initial_proposal: str, num_proposals: int, api_key: str,
+                  stream_writer: Optional[Callable[[Dict[str, str]], None]] = None) -> Dict[str, str]:
+    """
+    Optimize `initial_proposal` for the DAO named `dao_name` based on an
+    analysis of `num_proposals` of its Snapshot proposals: the most recent
+    ones, or with retrieval on (RETRIEVAL_POOL_FACTOR) the most recent few
+    and the past proposals most similar to `initial_proposal`.
+
+    Returns the matched space id, the DAO analysis and the optimized proposal.
+    Optimized proposal tokens are passed to `stream_writer` as they arrive.
+
+    Raises:
+        OptimizerError: If the DAO is not found or any stage fails
+    """
+    # The translation only depends on the initial proposal, so it runs in the background
+    # while the Snapshot fetch and indexing run, and also the analysis unless retrieval
+    # needs the English proposal to pick the proposals to analyze
+    executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="deo-translation")
+    try:
+        translation = executor.submit(in_current_context(translate_proposal), initial_proposal, api_key)
+
+        prepared = prepare_dao_data(dao_name, num_proposals, api_key)
+
+        dao_data = prepared["dao_data"]
+        if len(dao_data["proposals"]) > num_proposals:
+            dao_data = select_relevant_proposals(dao_data, translation.result(), num_proposals, api_key)
+
+        dao_analysis = analyze_dao_data(dao_data, api_key)
+
+        english_proposal = translation.result()
+
+        optimized_text = optimize_proposal(english_proposal, dao_analysis, api_key, stream_writer)
+
+        return {
+            "space_id": prepared["space_id"],
+            "dao_analysis": dao_analysis,
+            "optimized_proposal": optimized_text
+        }
+        
+    except OptimizerError:
+        raise
+    except Exception as e:
+        raise OptimizerError(f"Error in proposal optimization process: {str(e)}")
+    finally:
+        # Don't hold up the error path waiting on a translation nobody will use
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def format_optimizer_result(result: Dict[str, str]) -> str:
+    """Labeled text the chat UI splits into the hidden analysis and the visible optimized proposal."""
+    return (
+        f"DAO_ANALYSIS:\n{result['dao_analysis']}\nEND_ANALYSIS\n\n"
+        f"OPTIMIZED_PROPOSAL:\n{result['optimized_proposal']}"
+    )
@@ -0,0 +1,164 @@
+import os
+import re
+import threading
+from collections import defaultdict
+from typing import Dict, Any, List, Optional
+import numpy as np
+from llm import embed_texts, EMBEDDING_MODEL
+
+# Retrieval is opt-in. Above 1, a request analyzing n proposals fetches and embeds the
+# n * RETRIEVAL_POOL_FACTOR most recent ones (at most RETRIEVAL_POOL_SIZE) and analyzes those most
+# similar to the user's proposal. That finds older related proposals, but downloads and embeds
+# several times more, and since the analyzed set then depends on the user's proposal, the analysis
+# is seldom reused from the cache, shared between concurrent requests or prebuilt by the warm-up.
+# 1 analyzes the n most recent proposals.
+RETRIEVAL_POOL_FACTOR = int(os.environ.get("RETRIEVAL_POOL_FACTOR", 1))
+RETRIEVAL_POOL_SIZE = int(os.environ.get("RETRIEVAL_POOL_SIZE", 500))
+# Most recent proposals always included in the analysis, whatever their similarity
+RETRIEVAL_RECENT = int(os.environ.get("RETRIEVAL_RECENT", 5))
+# Optional directory each space's embeddings are persisted to as NumPy arrays
+RETRIEVAL_INDEX_DIR = os.environ.get("RETRIEVAL_INDEX_DIR")
+
+# Characters of a proposal (title and body) or of the user's proposal that are embedded
+EMBEDDING_TEXT_CHARS = 4000
+
+if RETRIEVAL_POOL_FACTOR < 1:
+    raise ValueError(f"RETRIEVAL_POOL_FACTOR must be at least 1, not {RETRIEVAL_POOL_FACTOR}")
+
+
+def proposal_text(proposal: Dict[str, Any]) -> str:
+    return f"{proposal.get('title') or ''}\n\n{proposal.get('body') or ''}"[:EMBEDDING_TEXT_CHARS]
+
+
+class ProposalIndex:
+    """
+    Embeddings of each space's proposals, kept as one L2-normalized float32
+    matrix per space (row i belongs to proposal ids[i]) and optionally saved
+    to `path` as .npz files.
+
+    Updating a space only embeds the proposals it has not seen yet, so a
+    space's history is embedded once and each later request only pays for
+    its new proposals and the user's proposal.
+    """
+
+    def __init__(self, path: Optional[str] = RETRIEVAL_INDEX_DIR, model: str = EMBEDDING_MODEL):
+        self.path = path
+        self.model = model
+        self._ids: Dict[str, List[str]] = {}
+        self._vectors: Dict[str, np.ndarray] = {}
+        self._locks: Dict[str, threading.Lock] = defaultdict(threading.Lock)
+        self._locks_lock = threading.Lock()
+
+    def update(self, space_id: str, proposals: List[Dict[str, Any]], api_key: str) -> None:
+        """Embed and add the `proposals` the space's index does not hold yet."""
+        with self._space_lock(space_id):
+            ids, vectors = self._get(space_id)
+            known = set(ids)
+            new = [proposal for proposal in proposals if proposal["id"] not in known]
+            if not new:
+                return
+
+            new_vectors = normalize(np.asarray(embed_texts(api_key, [proposal_text(p) for p in new]), dtype=np.float32))
+            ids = ids + [proposal["id"] for proposal in new]
+            vectors = new_vectors if not len(vectors) else np.vstack([vectors, new_vectors])
+            self._ids[space_id], self._vectors[space_id] = ids, vectors
+            self._save(space_id)
+
+    def most_similar(self, space_id: str, query_vector: np.ndarray, candidate_ids: List[str], k: int) -> List[str]:
+        """Ids of the `k` indexed `candidate_ids` closest to `query_vector`, most similar first."""
+        with self._space_lock(space_id):
+            ids, vectors = self._get(space_id)
+        positions = {proposal_id: position for position, proposal_id in enumerate(ids)}
+        rows = np.array([positions[i] for i in candidate_ids if i in positions], dtype=np.intp)
+        if k <= 0 or not len(rows):
+            return []
+
+        scores = vectors[rows] @ query_vector
+        k = min(k, len(rows))
+        best = np.argpartition(-scores, k - 1)[:k]
+        best = best[np.argsort(-scores[best])]
+        return [ids[rows[position]] for position in best]
+
+    def _space_lock(self, space_id: str) -> threading.Lock:
+        with self._locks_lock:
+            return self._locks[space_id]
+
+    def _get(self, space_id: str):
+        if space_id not in self._ids:
+            self._ids[space_id], self._vectors[space_id] = self._load(space_id)
+        return self._ids[space_id], self._vectors[space_id]
+
+    def _file_path(self, space_id: str) -> str:
+        return os.path.join(self.path, re.sub(r"[^A-Za-z0-9_.-]", "_", space_id) + ".npz")
+
+    def _load(self, space_id: str):
+        empty = ([], np.zeros((0, 0), dtype=np.float32))
+        if not self.path or not os.path.exists(self._file_path(space_id)):
+            return empty
+
+        try:
+            with np.load(self._file_path(space_id), allow_pickle=False) as stored:
+                # Vectors from another embedding model are not comparable with new ones
+                if str(stored["model"]) != self.model:
+                    return empty
+                return [str(proposal_id) for proposal_id in stored["ids"]], stored["vectors"].astype(np.float32)
+        except (OSError, ValueError, KeyError):
+            return empty
+
+    def _save(self, space_id: str) -> None:
+        if not self.path:
+            return
+
+        tmp_path = f"{self._file_path(space_id)}.tmp.npz"
+        try:
+            os.makedirs(self.path, exist_ok=True)
+            np.savez(
+                tmp_path,
+                model=np.array(self.model),
+                ids=np.array(self._ids[space_id]),
+                vectors=self._vectors[space_id]
+            )
+            os.replace(tmp_path, self._file_path(space_id))
+        except OSError:
+            pass
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+def retrieval_pool_size(num_proposals: int) -> int:
+    """Proposals to fetch for a request analyzing `num_proposals` of them."""
+    if RETRIEVAL_POOL_FACTOR <= 1:
+        return num_proposals
+    return max(num_proposals, min(num_proposals * RETRIEVAL_POOL_FACTOR, RETRIEVAL_POOL_SIZE))
+
+
+def select_proposals(dao_data: Dict[str, Any], english_proposal: str, num_proposals: int,
+                     api_key: str) -> Dict[str, Any]:
+    """
+    Narrow `dao_data`'s proposals (newest first) to the RETRIEVAL_RECENT most
+    recent ones plus those most similar to `english_proposal`,
+    `num_proposals` in all, returned newest first.
+    """
+    proposals = dao_data["proposals"]
+    if len(proposals) <= num_proposals:
+        return dao_data
+
+    space_id = dao_data["space"]["id"]
+    proposal_index.update(space_id, proposals, api_key)
+
+    recent = proposals[:min(RETRIEVAL_RECENT, num_proposals)]
+    recent_ids = {proposal["id"] for proposal in recent}
+    candidate_ids = [proposal["id"] for proposal in proposals if proposal["id"] not in recent_ids]
+    query_vector = normalize(np.asarray(embed_texts(api_key, [english_proposal[:EMBEDDING_TEXT_CHARS]])[0],
+                                        dtype=np.float32))
+    selected_ids = recent_ids | set(
+        proposal_index.most_similar(space_id, query_vector, candidate_ids, num_proposals - len(recent))
+    )
+
+    return {**dao_data, "proposals": [proposal for proposal in proposals if proposal["id"] in selected_ids]}
+
+
+proposal_index = ProposalIndex()
@@ -0,0 +1,280 @@
+"""
+Persistent chat history.
+
+Every chat message, including the hidden DAO analyses, is appended to a
+session store keyed by a random session id kept in the Streamlit session.
+Only the most recent messages stay in that session (see `trim_resident`);
+older ones are read back from the store when the user asks for them, so
+server memory grows with the number of active sessions rather than with the
+length of their histories. The id of an optimization job still running for
+a session is kept in the store as well, so its result can be added to the
+conversation when the session is restored.
+
+With SESSION_URL_RESTORE=1 the app also puts the session id in the page's
+query parameters, so a refreshed page, or the same page after a restart,
+finds its conversation again. The id is then the only key to the
+conversation: anyone given the link can read the whole history, hidden
+analyses included, and add to it. Only turn it on where page URLs are not
+shared.
+
+Two backends are available, chosen with SESSION_STORE:
+
+    sqlite  one SQLite database for all sessions (SESSION_STORE_PATH, default deo_sessions.sqlite3)
+    files   one append-only JSON Lines file per session (SESSION_STORE_PATH, default deo_sessions/)
+"""
+import os
+import re
+import json
+import time
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from collections import defaultdict, deque
+from typing import Dict, Any, List, Optional, Tuple
+
+# Session store backend: "sqlite" or "files"
+SESSION_STORE = os.environ.get("SESSION_STORE", "sqlite")
+# Database file or directory of the session store; defaults depend on the backend
+SESSION_STORE_PATH = os.environ.get("SESSION_STORE_PATH")
+# Sessions without a new message for this long are deleted
+SESSION_RETENTION = int(os.environ.get("SESSION_RETENTION", 30 * 24 * 60 * 60))
+# Most messages, and characters of message content, each session keeps in memory
+SESSION_RESIDENT_MESSAGES = int(os.environ.get("SESSION_RESIDENT_MESSAGES", 40))
+SESSION_RESIDENT_CHARS = int(os.environ.get("SESSION_RESIDENT_CHARS", 100000))
+# Keep the session id in the page URL so conversations survive refreshes; see the module docstring
+SESSION_URL_RESTORE = os.environ.get("SESSION_URL_RESTORE", "").lower() in ("1", "true", "yes")
+
+# Message fields written to the store; anything else (such as cached display text) is derived
+STORED_FIELDS = ("role", "content")
+
+CHAT_ROLES = ("user", "assistant")
+
+if SESSION_STORE not in ("sqlite", "files"):
+    raise ValueError(f"SESSION_STORE must be one of sqlite, files, not '{SESSION_STORE}'")
+
+
+def stored_message(message: Dict[str, Any]) -> Dict[str, Any]:
+    return {field: message[field] for field in STORED_FIELDS if field in message}
+
+
+class SessionStore(ABC):
+    """Append-only message history per session."""
+
+    @abstractmethod
+    def append(self, session_id: str, message: Dict[str, Any]) -> None:
+        ...
+
+    @abstractmethod
+    def recent(self, session_id: str, limit: int) -> List[Dict[str, Any]]:
+        """The session's last `limit` messages of any role, oldest first."""
+
+    @abstractmethod
+    def recent_chat(self, session_id: str, limit: int) -> Tuple[List[Dict[str, Any]], bool]:
+        """The session's last `limit` user and assistant messages, oldest first, and whether there are earlier ones."""
+
+    @abstractmethod
+    def set_pending_job(self, session_id: str, job_id: Optional[str]) -> None:
+        """Record the session's running optimization job, or clear it with None."""
+
+    @abstractmethod
+    def pending_job(self, session_id: str) -> Optional[str]:
+        ...
+
+    @abstractmethod
+    def delete_inactive_before(self, timestamp: float) -> None:
+        ...
+
+
+class SQLiteSessionStore(SessionStore):
+    """All sessions in one SQLite database; safe to share between threads and processes."""
+
+    def __init__(self, path: str = "deo_sessions.sqlite3"):
+        self.path = path
+        with self._connect() as connection:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("""
+                CREATE TABLE IF NOT EXISTS messages (
+                    session_id TEXT NOT NULL,
+                    seq INTEGER NOT NULL,
+                    role TEXT NOT NULL,
+                    message TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    PRIMARY KEY (session_id, seq)
+                )
+            """)
+            connection.execute("""
+                CREATE TABLE IF NOT EXISTS pending_jobs (
+                    session_id TEXT PRIMARY KEY,
+                    job_id TEXT NOT NULL,
+                    created_at REAL NOT NULL
+                )
+            """)
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=30)
+
+    def append(self, session_id: str, message: Dict[str, Any]) -> None:
+        with self._connect() as connection:
+            connection.execute(
+                "INSERT INTO messages (session_id, seq, role, message, created_at) "
+                "SELECT ?, COALESCE(MAX(seq), 0) + 1, ?, ?, ? FROM messages WHERE session_id = ?",
+                (session_id, message["role"], json.dumps(stored_message(message)), time.time(), session_id)
+            )
+
+    def recent(self, session_id: str, limit: int) -> List[Dict[str, Any]]:
+        with self._connect() as connection:
+            rows = connection.execute(
+                "SELECT message FROM messages WHERE session_id = ? ORDER BY seq DESC LIMIT ?",
+                (session_id, limit)
+            ).fetchall()
+        return [json.loads(row[0]) for row in reversed(rows)]
+
+    def recent_chat(self, session_id: str, limit: int) -> Tuple[List[Dict[str, Any]], bool]:
+        with self._connect() as connection:
+            rows = connection.execute(
+                "SELECT message FROM messages WHERE session_id = ? AND role IN (?, ?) ORDER BY seq DESC LIMIT ?",
+                (session_id, *CHAT_ROLES, limit + 1)
+            ).fetchall()
+        return [json.loads(row[0]) for row in reversed(rows[:limit])], len(rows) > limit
+
+    def set_pending_job(self, session_id: str, job_id: Optional[str]) -> None:
+        with self._connect() as connection:
+            if job_id is None:
+                connection.execute("DELETE FROM pending_jobs WHERE session_id = ?", (session_id,))
+            else:
+                connection.execute(
+                    "INSERT OR REPLACE INTO pending_jobs (session_id, job_id, created_at) VALUES (?, ?, ?)",
+                    (session_id, job_id, time.time())
+                )
+
+    def pending_job(self, session_id: str) -> Optional[str]:
+        with self._connect() as connection:
+            row = connection.execute("SELECT job_id FROM pending_jobs WHERE session_id = ?", (session_id,)).fetchone()
+        return row[0] if row is not None else None
+
+    def delete_inactive_before(self, timestamp: float) -> None:
+        with self._connect() as connection:
+            connection.execute(
+                "DELETE FROM messages WHERE session_id IN "
+                "(SELECT session_id FROM messages GROUP BY session_id HAVING MAX(created_at) < ?)",
+                (timestamp,)
+            )
+            connection.execute("DELETE FROM pending_jobs WHERE created_at < ?", (timestamp,))
+
+
+class FileSessionStore(SessionStore):
+    """One append-only JSON Lines file per session under `path`."""
+
+    def __init__(self, path: str = "deo_sessions"):
+        self.path = path
+        os.makedirs(self.path, exist_ok=True)
+        self._locks: Dict[str, threading.Lock] = defaultdict(threading.Lock)
+        self._locks_lock = threading.Lock()
+
+    def _session_lock(self, session_id: str) -> threading.Lock:
+        with self._locks_lock:
+            return self._locks[session_id]
+
+    def _file_path(self, session_id: str, extension: str = ".jsonl") -> str:
+        return os.path.join(self.path, re.sub(r"[^A-Za-z0-9_.-]", "_", session_id) + extension)
+
+    def append(self, session_id: str, message: Dict[str, Any]) -> None:
+        line = json.dumps(stored_message(message)) + "\n"
+        with self._session_lock(session_id), open(self._file_path(session_id), "a", encoding="utf-8") as f:
+            f.write(line)
+
+    def _read(self, session_id: str, limit: int, roles: Optional[Tuple[str, ...]] = None):
+        """The last `limit` messages with one of `roles` and how many matching messages there are in all."""
+        recent = deque(maxlen=limit)
+        count = 0
+        try:
+            with self._session_lock(session_id), open(self._file_path(session_id), "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        message = json.loads(line)
+                    except ValueError:
+                        # A line cut short by a crash mid-write
+                        continue
+                    if roles is None or message.get("role") in roles:
+                        recent.append(message)
+                        count += 1
+        except OSError:
+            pass
+        return list(recent), count
+
+    def recent(self, session_id: str, limit: int) -> List[Dict[str, Any]]:
+        return self._read(session_id, limit)[0]
+
+    def recent_chat(self, session_id: str, limit: int) -> Tuple[List[Dict[str, Any]], bool]:
+        messages, count = self._read(session_id, limit, CHAT_ROLES)
+        return messages, count > limit
+
+    def set_pending_job(self, session_id: str, job_id: Optional[str]) -> None:
+        # Kept next to the session's messages in a one-line .job file
+        file_path = self._file_path(session_id, ".job")
+        with self._session_lock(session_id):
+            try:
+                if job_id is None:
+                    os.remove(file_path)
+                else:
+                    with open(file_path, "w", encoding="utf-8") as f:
+                        f.write(job_id)
+            except FileNotFoundError:
+                pass
+
+    def pending_job(self, session_id: str) -> Optional[str]:
+        try:
+            with self._session_lock(session_id), open(self._file_path(session_id, ".job"), "r", encoding="utf-8") as f:
+                return f.read().strip() or None
+        except OSError:
+            return None
+
+    def delete_inactive_before(self, timestamp: float) -> None:
+        for name in os.listdir(self.path):
+            file_path = os.path.join(self.path, name)
+            try:
+                if name.endswith((".jsonl", ".job")) and os.path.getmtime(file_path) < timestamp:
+                    os.remove(file_path)
+            except OSError:
+                pass
+
+
+def trim_resident(messages: List[Dict[str, Any]], max_messages: int = SESSION_RESIDENT_MESSAGES,
+                  max_chars: int = SESSION_RESIDENT_CHARS) -> List[Dict[str, Any]]:
+    """
+    The most recent `messages` that fit in `max_messages` messages and
+    `max_chars` characters of content, always keeping the last message and
+    the latest hidden DAO analysis, which the agent still needs.
+    """
+    analyses = [position for position, message in enumerate(messages) if message["role"] == "system"]
+    latest_analysis = analyses[-1] if analyses else None
+
+    kept = [latest_analysis] if latest_analysis is not None else []
+    chars = sum(len(messages[position]["content"]) for position in kept)
+    for position in range(len(messages) - 1, -1, -1):
+        if position == latest_analysis:
+            continue
+        chars += len(messages[position]["content"])
+        if position < len(messages) - 1 and (len(kept) >= max_messages or chars > max_chars):
+            break
+        kept.append(position)
+    return [messages[position] for position in sorted(kept)]
+
+
+_session_store: Optional[SessionStore] = None
+_session_store_lock = threading.Lock()
+
+
+def get_session_store() -> SessionStore:
+    """Return this process's session store, deleting inactive sessions on first use."""
+    global _session_store
+    if _session_store is None:
+        with _session_store_lock:
+            if _session_store is None:
+                if SESSION_STORE == "files":
+                    store = FileSessionStore(SESSION_STORE_PATH or "deo_sessions")
+                else:
+                    store = SQLiteSessionStore(SESSION_STORE_PATH or "deo_sessions.sqlite3")
+                store.delete_inactive_before(time.time() - SESSION_RETENTION)
+                _session_store = store
+    return _session_store
@@ -0,0 +1,807 @@
+import os
+import re
+import json
+import time
+import random
+import difflib
+import threading
+import requests
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, Optional, Tuple
+from telemetry import record, in_current_context
+from cache import SingleFlight
+
+SNAPSHOT_API_URL = os.environ.get("SNAPSHOT_API_URL", "https://hub.snapshot.org/graphql")
+
+# Seconds to wait for a connection and for each response read, per attempt
+SNAPSHOT_CONNECT_TIMEOUT = float(os.environ.get("SNAPSHOT_CONNECT_TIMEOUT", 5))
+SNAPSHOT_READ_TIMEOUT = float(os.environ.get("SNAPSHOT_READ_TIMEOUT", 20))
+# Retries for timeouts, connection errors, 429 and 5xx responses
+SNAPSHOT_MAX_RETRIES = int(os.environ.get("SNAPSHOT_MAX_RETRIES", 3))
+# Longest single backoff, also the cap applied to a server's Retry-After
+SNAPSHOT_MAX_BACKOFF = float(os.environ.get("SNAPSHOT_MAX_BACKOFF", 10))
+# Maximum number of requests in flight to Snapshot from this process
+SNAPSHOT_CONCURRENCY = int(os.environ.get("SNAPSHOT_CONCURRENCY", 4))
+
+# How long a loaded space directory is served before a background refresh is started
+SPACE_DIRECTORY_TTL = int(os.environ.get("SPACE_DIRECTORY_TTL", 6 * 60 * 60))
+# Incremental refreshes only see newly created spaces, so re-crawl everything at this interval
+SPACE_DIRECTORY_FULL_REFRESH = int(os.environ.get("SPACE_DIRECTORY_FULL_REFRESH", 24 * 60 * 60))
+# Optional JSON file the directory is persisted to, so restarts don't pay for a full crawl
+SPACE_DIRECTORY_PATH = os.environ.get("SPACE_DIRECTORY_PATH")
+
+SPACES_PAGE_SIZE = 1000
+
+# Number of trigram-ranked candidates that get the full similarity scoring, plus any tied with the last
+SPACE_INDEX_SHORTLIST = 64
+
+# Optional directory the proposal store persists each space's proposals to
+PROPOSAL_STORE_DIR = os.environ.get("PROPOSAL_STORE_DIR")
+# Cached proposals younger than this are served without asking Snapshot for changes
+PROPOSAL_STORE_MIN_REFRESH = int(os.environ.get("PROPOSAL_STORE_MIN_REFRESH", 30))
+# Space settings (strategies, admins, members, ...) change rarely, so refetch them at this interval
+SPACE_METADATA_TTL = int(os.environ.get("SPACE_METADATA_TTL", 60 * 60))
+
+# Proposals in these states can still change their state and scores
+OPEN_PROPOSAL_STATES = ("pending", "active")
+
+# Fields fetched for each space and proposal and how they are pruned for analysis: minimal, standard or full
+DAO_DATA_PROFILE = os.environ.get("DAO_DATA_PROFILE", "standard")
+# Characters of each proposal body kept by the standard profile
+PROPOSAL_BODY_CHARS = int(os.environ.get("PROPOSAL_BODY_CHARS", 500))
+# Characters of the space's 'about' text kept by the pruned profiles
+SPACE_ABOUT_CHARS = 500
+
+
+class SnapshotError(Exception):
+    """Raised when the Snapshot GraphQL API returns an error or an unusable response."""
+
+
+class SnapshotClient:
+    """
+    Shared Snapshot GraphQL client.
+
+    Requests go through one keep-alive `requests.Session` whose connection
+    pool is sized for `concurrency` parallel requests, and no more than that
+    many are in flight at once, whichever threads send them. Every attempt
+    has a connect and read timeout, and timeouts, connection errors, 429 and
+    5xx responses are retried with exponential backoff (honouring Retry-After).
+    `map` runs independent queries, such as pages of a listing, on a bounded
+    thread pool.
+    """
+
+    RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+    def __init__(self, url: str = SNAPSHOT_API_URL, connect_timeout: float = SNAPSHOT_CONNECT_TIMEOUT,
+                 read_timeout: float = SNAPSHOT_READ_TIMEOUT, max_retries: int = SNAPSHOT_MAX_RETRIES,
+                 max_backoff: float = SNAPSHOT_MAX_BACKOFF, concurrency: int = SNAPSHOT_CONCURRENCY):
+        self.url = url
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.max_backoff = max_backoff
+        self.concurrency = concurrency
+
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=concurrency)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self._executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="snapshot")
+        # Held only while a request is in flight, not during backoff
+        self._slots = threading.BoundedSemaphore(concurrency)
+
+    def query(self, query: str, variables: Dict[str, Any]) -> Dict[str, Any]:
+        """Run a GraphQL query and return its `data`, raising SnapshotError on failure."""
+        attempt = 0
+        while True:
+            try:
+                with self._slots:
+                    response = self.session.post(
+                        self.url,
+                        json={"query": query, "variables": variables},
+                        timeout=self.timeout
+                    )
+            except (requests.exceptions.Timeout, requests.exceptions.ConnectionError) as e:
+                if attempt >= self.max_retries:
+                    raise SnapshotError(f"API request failed: {str(e)}")
+                self._sleep(attempt)
+                attempt += 1
+                continue
+
+            record(http_requests=1, http_bytes=len(response.content))
+            if response.status_code in self.RETRY_STATUS_CODES and attempt < self.max_retries:
+                self._sleep(attempt, response.headers.get("Retry-After"))
+                attempt += 1
+                continue
+
+            if response.status_code != 200:
+                raise SnapshotError(f"Snapshot API request failed: {response.text}")
+
+            data = response.json()
+            if "errors" in data:
+                raise SnapshotError(f"Snapshot API returned errors: {data['errors']}")
+            return data.get("data") or {}
+
+    def map(self, fn, items: List[Any]) -> List[Any]:
+        """Apply `fn` to `items` concurrently on the client's thread pool, preserving order."""
+        return list(self._executor.map(in_current_context(fn), items))
+
+    def _sleep(self, attempt: int, retry_after: Optional[str] = None) -> None:
+        delay = None
+        if retry_after:
+            try:
+                delay = float(retry_after)
+            except ValueError:
+                pass
+        if delay is None:
+            delay = (2 ** attempt) * 0.5 + random.uniform(0, 0.25)
+        time.sleep(min(delay, self.max_backoff))
+
+
+def clean_name(name: str) -> str:
+    name = name.lower()
+    name = re.sub(r'\b(dao|protocol|finance|v[0-9]+|governance)\b', '', name)
+    name = ' '.join(name.split())
+    return name
+
+
+def calculate_similarity(name1: str, name2: str, space_id: str) -> float:
+    if name1.lower() == space_id.lower():
+        return 1.0
+    
+    name1_clean = clean_name(name1)
+    name2_clean = clean_name(name2)
+    
+    if name1_clean == name2_clean:
+        return 1.0
+        
+    base_similarity = difflib.SequenceMatcher(None, name1_clean, name2_clean).ratio()
+    
+    if name1_clean in name2_clean or name2_clean in name1_clean:
+        return base_similarity + 0.3
+    
+    length_ratio = min(len(name1_clean), len(name2_clean)) / max(len(name1_clean), len(name2_clean))
+    if length_ratio < 0.5:
+        return base_similarity * 0.5
+        
+    words1 = set(name1_clean.split())
+    words2 = set(name2_clean.split())
+    if words1 and words2:
+        word_match_ratio = len(words1.intersection(words2)) / max(len(words1), len(words2))
+        if len(words1.intersection(words2)) == 0:
+            return base_similarity * 0.3
+    else:
+        word_match_ratio = 0
+    
+    return min((base_similarity * 0.7) + (word_match_ratio * 0.3), 1.0)
+
+
+def trigrams(text: str) -> set:
+    """Character trigrams of `text`, padded so that short names still produce some."""
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class SpaceNameIndex:
+    """
+    Character-trigram inverted index over cleaned space names and ids.
+
+    A lookup ranks spaces by how many trigrams their cleaned name (or id)
+    shares with the cleaned query (or lowercased query), as a share of the
+    smaller trigram set so that names contained in one another rank first,
+    with ties going to the closer length. Only the best `shortlist`
+    candidates, plus every other space sharing as large a share of trigrams
+    as the last of them, get the full `calculate_similarity` scoring, along
+    with exact id and cleaned-name hits and every space whose cleaned name
+    contains or is contained in the cleaned query: the substring bonus is the
+    only way to score above 1.0, so those are found exactly rather than
+    through the trigram rank.
+    """
+
+    def __init__(self, spaces: List[Dict[str, Any]], shortlist: int = SPACE_INDEX_SHORTLIST):
+        self.shortlist = shortlist
+        self._spaces: List[Tuple[str, str]] = []
+        self._name_postings: Dict[str, List[int]] = defaultdict(list)
+        self._name_gram_counts: List[int] = []
+        self._id_postings: Dict[str, List[int]] = defaultdict(list)
+        self._id_gram_counts: List[int] = []
+        self._by_id: Dict[str, int] = {}
+        self._by_clean_name: Dict[str, List[int]] = defaultdict(list)
+        self._clean_names: List[str] = []
+
+        for space in spaces:
+            if not space.get("name") or not space.get("id"):
+                continue
+
+            position = len(self._spaces)
+            name_clean = clean_name(space["name"])
+            name_grams = trigrams(name_clean)
+            id_grams = trigrams(space["id"].lower())
+
+            self._spaces.append((space["id"], space["name"]))
+            self._name_gram_counts.append(len(name_grams))
+            self._id_gram_counts.append(len(id_grams))
+            for gram in name_grams:
+                self._name_postings[gram].append(position)
+            for gram in id_grams:
+                self._id_postings[gram].append(position)
+            self._by_id[space["id"].lower()] = position
+            self._by_clean_name[name_clean].append(position)
+            self._clean_names.append(name_clean)
+
+    def __len__(self) -> int:
+        return len(self._spaces)
+
+    @staticmethod
+    def _rank(query_grams: set, postings: Dict[str, List[int]], gram_counts: List[int]) -> Dict[int, Tuple[float, float]]:
+        overlap: Dict[int, int] = defaultdict(int)
+        for gram in query_grams:
+            for position in postings.get(gram, ()):
+                overlap[position] += 1
+
+        ranks = {}
+        for position, shared in overlap.items():
+            containment = shared / min(len(query_grams), gram_counts[position])
+            dice = 2 * shared / (len(query_grams) + gram_counts[position])
+            ranks[position] = (containment, dice)
+        return ranks
+
+    def candidates(self, dao_name: str) -> List[int]:
+        """Positions of the spaces worth scoring for `dao_name`."""
+        query_clean = clean_name(dao_name)
+        if not query_clean:
+            # An empty cleaned name is a substring of everything, so no pruning is safe
+            return list(range(len(self._spaces)))
+
+        ranks = self._rank(trigrams(query_clean), self._name_postings, self._name_gram_counts)
+        for position, rank in self._rank(trigrams(dao_name.lower()), self._id_postings, self._id_gram_counts).items():
+            ranks[position] = max(rank, ranks.get(position, rank))
+
+        ranked = sorted(ranks, key=ranks.get, reverse=True)
+        # Spaces level with the last shortlisted one on the primary rank can score as well as it
+        cut = min(self.shortlist, len(ranked))
+        if 0 < cut < len(ranked):
+            cutoff = ranks[ranked[cut - 1]][0]
+            while cut < len(ranked) and ranks[ranked[cut]][0] >= cutoff:
+                cut += 1
+        shortlist = set(ranked[:cut])
+        shortlist.update(self._substring_matches(query_clean))
+        if dao_name.lower() in self._by_id:
+            shortlist.add(self._by_id[dao_name.lower()])
+        return list(shortlist)
+
+    def _substring_matches(self, query_clean: str) -> set:
+        """Positions of the spaces whose cleaned name contains, or is contained in, `query_clean`."""
+        matches = set()
+        # Names contained in the query, the query itself included, are looked up by every substring
+        for start in range(len(query_clean)):
+            for end in range(start, len(query_clean) + 1):
+                matches.update(self._by_clean_name.get(query_clean[start:end], ()))
+
+        # Names containing the query contain all of its unpadded trigrams
+        grams = {query_clean[i:i + 3] for i in range(len(query_clean) - 2)}
+        if grams:
+            postings = sorted((self._name_postings.get(gram, []) for gram in grams), key=len)
+            positions = set(postings[0]).intersection(*postings[1:])
+        else:
+            positions = range(len(self._spaces))
+        matches.update(position for position in positions if query_clean in self._clean_names[position])
+        return matches
+
+    def best_match(self, dao_name: str) -> Optional[Tuple[float, str, str]]:
+        """Return the highest scoring (similarity, space id, space name), or None if nothing is indexed."""
+        matches = []
+        for position in self.candidates(dao_name):
+            space_id, space_name = self._spaces[position]
+            matches.append((calculate_similarity(dao_name, space_name, space_id), space_id, space_name))
+
+        return max(matches) if matches else None
+
+
+def fetch_spaces_page(skip: int, created_gt: int = 0) -> List[Dict[str, Any]]:
+    """Fetch one page of verified spaces created after `created_gt`, oldest first."""
+    query = """
+    query($skip: Int!, $created_gt: Int!) {
+        spaces(
+            first: 1000,
+            skip: $skip,
+            where: {
+                verified: true,
+                created_gt: $created_gt
+            },
+            orderBy: "created",
+            orderDirection: asc
+        ) {
+            id
+            name
+            created
+        }
+    }
+    """
+    data = snapshot_client.query(query, {"skip": skip, "created_gt": created_gt})
+    return data.get("spaces") or []
+
+
+def fetch_spaces(created_gt: int = 0) -> List[Dict[str, Any]]:
+    """Page through every verified space created after `created_gt`, several pages at a time."""
+    skip = 0
+    all_spaces = []
+
+    while True:
+        skips = [skip + i * SPACES_PAGE_SIZE for i in range(snapshot_client.concurrency)]
+        pages = snapshot_client.map(lambda page_skip: fetch_spaces_page(page_skip, created_gt), skips)
+
+        for spaces in pages:
+            all_spaces.extend(spaces)
+            if len(spaces) < SPACES_PAGE_SIZE:
+                record(spaces=len(all_spaces))
+                return all_spaces
+        skip = skips[-1] + SPACES_PAGE_SIZE
+
+
+SPACE_FIELDS = """
+            id
+            name
+            about
+            avatar
+            network
+            symbol
+            strategies {
+                name
+                params
+            }
+            admins
+            moderators
+            members
+            filters {
+                minScore
+                onlyMembers
+            }
+            plugins
+"""
+
+PROPOSAL_FIELDS = """
+            id
+            title
+            body
+            choices
+            start
+            end
+            snapshot
+            state
+            author
+            created
+            scores
+            scores_total
+"""
+
+# The minimal profile leaves out address lists, plugins, strategy params and proposal bodies
+MINIMAL_SPACE_FIELDS = """
+            id
+            name
+            about
+            network
+            symbol
+            strategies {
+                name
+            }
+            filters {
+                minScore
+                onlyMembers
+            }
+"""
+
+MINIMAL_PROPOSAL_FIELDS = """
+            id
+            title
+            choices
+            start
+            end
+            state
+            author
+            created
+            scores
+            scores_total
+"""
+
+# body_chars: characters of each body kept for analysis (0 when bodies are not fetched, None for no pruning)
+FIELD_PROFILES = {
+    "minimal": {"space_fields": MINIMAL_SPACE_FIELDS, "proposal_fields": MINIMAL_PROPOSAL_FIELDS, "body_chars": 0},
+    "standard": {"space_fields": SPACE_FIELDS, "proposal_fields": PROPOSAL_FIELDS, "body_chars": PROPOSAL_BODY_CHARS},
+    "full": {"space_fields": SPACE_FIELDS, "proposal_fields": PROPOSAL_FIELDS, "body_chars": None},
+}
+
+if DAO_DATA_PROFILE not in FIELD_PROFILES:
+    raise ValueError(f"DAO_DATA_PROFILE must be one of {', '.join(FIELD_PROFILES)}, not '{DAO_DATA_PROFILE}'")
+
+
+def shorten_body(body: str, max_chars: int) -> str:
+    """
+    Cap a proposal body at about `max_chars` characters, dropping images and
+    link targets first and listing the headings of the part that was cut.
+    """
+    body = re.sub(r"!\[[^\]]*\]\([^)]*\)", "", body)
+    body = re.sub(r"\[([^\]]*)\]\([^)]*\)", r"\1", body)
+    body = re.sub(r"[ \t]+", " ", body)
+    body = re.sub(r"\n\s*\n+", "\n\n", body).strip()
+    if len(body) <= max_chars:
+        return body
+
+    kept, rest = body[:max_chars], body[max_chars:]
+    headings = re.findall(r"^#+\s*(.+)$", rest, flags=re.MULTILINE)
+    shortened = f"{kept.rstrip()} [... {len(rest)} more characters]"
+    if headings:
+        shortened += f" [later sections: {' | '.join(heading.strip() for heading in headings)}]"
+    return shortened
+
+
+def prune_dao_data(dao_data: Dict[str, Any], profile: str = DAO_DATA_PROFILE) -> Dict[str, Any]:
+    """
+    Shrink `dao_data` for the analysis prompt according to `profile`: address
+    lists become counts, plugins and strategy params are dropped, scores are
+    rounded and proposal bodies are capped. The full profile keeps everything.
+    """
+    body_chars = FIELD_PROFILES[profile]["body_chars"]
+    if body_chars is None:
+        return {**dao_data, "profile": profile}
+
+    space = {key: value for key, value in dao_data["space"].items() if key not in ("avatar", "plugins")}
+    for field in ("admins", "moderators", "members"):
+        if field in space:
+            space[f"{field}_count"] = len(space.pop(field) or [])
+    if space.get("strategies"):
+        space["strategies"] = [{"name": strategy.get("name")} for strategy in space["strategies"]]
+    if space.get("about"):
+        space["about"] = shorten_body(space["about"], SPACE_ABOUT_CHARS)
+
+    proposals = []
+    for proposal in dao_data["proposals"]:
+        pruned = {key: value for key, value in proposal.items() if key not in ("body", "snapshot")}
+        if proposal.get("body"):
+            pruned["body_length"] = len(proposal["body"])
+            if body_chars:
+                pruned["body"] = shorten_body(proposal["body"], body_chars)
+        if proposal.get("scores"):
+            pruned["scores"] = [round(score or 0, 2) for score in proposal["scores"]]
+        if proposal.get("scores_total") is not None:
+            pruned["scores_total"] = round(proposal["scores_total"], 2)
+        proposals.append(pruned)
+
+    return {**dao_data, "space": space, "proposals": proposals, "profile": profile}
+
+
+def fetch_space_data(space_id: str, num_proposals: int, profile: str = DAO_DATA_PROFILE) -> Dict[str, Any]:
+    """Fetch a space's settings and its `num_proposals` most recently created proposals."""
+    fields = FIELD_PROFILES[profile]
+    space_query = f"""
+    query GetSpaceData($space_id: String!, $num_proposals: Int!) {{
+        space(id: $space_id) {{
+            {fields["space_fields"]}
+        }}
+        proposals(
+            first: $num_proposals,
+            skip: 0,
+            where: {{
+                space: $space_id
+            }},
+            orderBy: "created",
+            orderDirection: desc
+        ) {{
+            {fields["proposal_fields"]}
+        }}
+    }}
+    """
+    data = snapshot_client.query(space_query, {"space_id": space_id, "num_proposals": num_proposals})
+
+    if data.get("space") is None:
+        raise SnapshotError(f"DAO space '{space_id}' not found")
+
+    record(proposals=len(data["proposals"]))
+    return {
+        "space": data["space"],
+        "proposals": data["proposals"]
+    }
+
+
+def fetch_proposal_changes(space_id: str, created_gt: int, open_ids: List[str], with_space: bool,
+                           profile: str = DAO_DATA_PROFILE) -> Dict[str, Any]:
+    """
+    Fetch, in one query, the proposals created after `created_gt`, the current
+    version of the `open_ids` proposals and, if `with_space`, the space settings.
+    """
+    fields = FIELD_PROFILES[profile]
+    delta_query = f"""
+    query GetProposalChanges($space_id: String!, $created_gt: Int!, $open_ids: [String],
+                             $with_open: Boolean!, $with_space: Boolean!) {{
+        space(id: $space_id) @include(if: $with_space) {{
+            {fields["space_fields"]}
+        }}
+        proposals(
+            first: 1000,
+            skip: 0,
+            where: {{
+                space: $space_id,
+                created_gt: $created_gt
+            }},
+            orderBy: "created",
+            orderDirection: desc
+        ) {{
+            {fields["proposal_fields"]}
+        }}
+        open: proposals(
+            first: 1000,
+            where: {{
+                id_in: $open_ids
+            }}
+        ) @include(if: $with_open) {{
+            {fields["proposal_fields"]}
+        }}
+    }}
+    """
+    data = snapshot_client.query(delta_query, {
+        "space_id": space_id,
+        "created_gt": created_gt,
+        "open_ids": open_ids,
+        "with_open": bool(open_ids),
+        "with_space": with_space
+    })
+
+    if with_space and data.get("space") is None:
+        raise SnapshotError(f"DAO space '{space_id}' not found")
+
+    record(proposals=len(data.get("proposals") or []) + len(data.get("open") or []))
+    return {
+        "space": data.get("space"),
+        "proposals": data.get("proposals") or [],
+        "open": data.get("open") or []
+    }
+
+
+class ProposalStore:
+    """
+    Local store of each space's settings and recent proposals, keyed by space id.
+
+    The first request for a space downloads its `num_proposals` most recent
+    proposals. Later requests only ask Snapshot for proposals created after
+    the newest cached `created` timestamp plus the still open (pending or
+    active) proposals whose state and scores may have changed, and merge them
+    in. Requests within `min_refresh` seconds of the last refresh are served
+    from the store, and concurrent requests for one space share a lock so only
+    one of them queries Snapshot.
+    """
+
+    def __init__(self, path: Optional[str] = PROPOSAL_STORE_DIR, min_refresh: int = PROPOSAL_STORE_MIN_REFRESH,
+                 space_ttl: int = SPACE_METADATA_TTL, profile: str = DAO_DATA_PROFILE):
+        self.path = path
+        self.profile = profile
+        self.min_refresh = min_refresh
+        self.space_ttl = space_ttl
+        self._entries: Dict[str, Dict[str, Any]] = {}
+        self._locks: Dict[str, threading.Lock] = defaultdict(threading.Lock)
+        self._locks_lock = threading.Lock()
+
+    def get(self, space_id: str, num_proposals: int) -> Dict[str, Any]:
+        """Return the space settings and its `num_proposals` most recent proposals."""
+        with self._space_lock(space_id):
+            entry = self._entries.get(space_id) or self._load(space_id)
+
+            if entry is None or (num_proposals > entry["depth"] and not entry["exhausted"]):
+                entry = self._fetch_all(space_id, num_proposals)
+            elif time.time() - entry["refreshed_at"] > self.min_refresh:
+                entry = self._fetch_changes(space_id, entry, num_proposals)
+
+            proposals = sorted(entry["proposals"].values(), key=lambda p: p.get("created") or 0, reverse=True)
+            return {
+                "space": entry["space"],
+                "proposals": proposals[:num_proposals]
+            }
+
+    def _space_lock(self, space_id: str) -> threading.Lock:
+        with self._locks_lock:
+            return self._locks[space_id]
+
+    def _fetch_all(self, space_id: str, num_proposals: int) -> Dict[str, Any]:
+        data = fetch_space_data(space_id, num_proposals, self.profile)
+        now = time.time()
+        entry = {
+            "profile": self.profile,
+            "space": data["space"],
+            "space_fetched_at": now,
+            "proposals": {proposal["id"]: proposal for proposal in data["proposals"]},
+            # Number of newest proposals held without gaps, and whether that is all of them
+            "depth": len(data["proposals"]),
+            "exhausted": len(data["proposals"]) < num_proposals,
+            "refreshed_at": now
+        }
+        self._store(space_id, entry)
+        return entry
+
+    def _fetch_changes(self, space_id: str, entry: Dict[str, Any], num_proposals: int) -> Dict[str, Any]:
+        now = time.time()
+        newest_created = max((p.get("created") or 0 for p in entry["proposals"].values()), default=0)
+        open_ids = [p["id"] for p in entry["proposals"].values() if p.get("state") in OPEN_PROPOSAL_STATES]
+        with_space = now - entry["space_fetched_at"] > self.space_ttl
+
+        changes = fetch_proposal_changes(space_id, newest_created, open_ids, with_space, self.profile)
+        if len(changes["proposals"]) >= 1000:
+            # Too many new proposals to merge without a gap; start over
+            return self._fetch_all(space_id, max(num_proposals, entry["depth"]))
+
+        proposals = dict(entry["proposals"])
+        returned_open_ids = {proposal["id"] for proposal in changes["open"]}
+        deleted_ids = [proposal_id for proposal_id in open_ids if proposal_id not in returned_open_ids]
+        for proposal_id in deleted_ids:
+            proposals.pop(proposal_id, None)
+        for proposal in changes["open"] + changes["proposals"]:
+            proposals[proposal["id"]] = proposal
+
+        entry = dict(entry)
+        entry["proposals"] = proposals
+        entry["depth"] = entry["depth"] + len(changes["proposals"]) - len(deleted_ids)
+        entry["refreshed_at"] = now
+        if with_space:
+            entry["space"] = changes["space"]
+            entry["space_fetched_at"] = now
+        self._store(space_id, entry)
+        return entry
+
+    def _file_path(self, space_id: str) -> str:
+        return os.path.join(self.path, re.sub(r"[^A-Za-z0-9_.-]", "_", space_id) + ".json")
+
+    def _load(self, space_id: str) -> Optional[Dict[str, Any]]:
+        if not self.path or not os.path.exists(self._file_path(space_id)):
+            return None
+
+        try:
+            with open(self._file_path(space_id), "r", encoding="utf-8") as f:
+                entry = json.load(f)
+            entry["proposals"] = {proposal["id"]: proposal for proposal in entry["proposals"]}
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+        # Saved with other fields; entries from before profiles existed hold the full set
+        if entry.get("profile", "full") != self.profile:
+            return None
+
+        self._entries[space_id] = entry
+        return entry
+
+    def _store(self, space_id: str, entry: Dict[str, Any]) -> None:
+        self._entries[space_id] = entry
+        if not self.path:
+            return
+
+        stored = dict(entry)
+        stored["proposals"] = list(entry["proposals"].values())
+        tmp_path = f"{self._file_path(space_id)}.tmp"
+        try:
+            os.makedirs(self.path, exist_ok=True)
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(stored, f)
+            os.replace(tmp_path, self._file_path(space_id))
+        except OSError:
+            pass
+
+
+class SpaceDirectory:
+    """
+    Process-wide directory of verified Snapshot spaces.
+
+    The directory is loaded once (from disk if a fresh enough copy exists,
+    otherwise by crawling Snapshot) and then served from memory. Once it is
+    older than `ttl` seconds, lookups keep returning the current copy while a
+    background thread fetches only the spaces created since the last refresh.
+    A full re-crawl runs every `full_refresh` seconds to pick up renamed or
+    newly verified spaces.
+    """
+
+    def __init__(self, ttl: int = SPACE_DIRECTORY_TTL, full_refresh: int = SPACE_DIRECTORY_FULL_REFRESH,
+                 path: Optional[str] = SPACE_DIRECTORY_PATH):
+        self.ttl = ttl
+        self.full_refresh = full_refresh
+        self.path = path
+        self._spaces: Dict[str, Dict[str, Any]] = {}
+        self._index = SpaceNameIndex([])
+        self._refreshed_at = 0.0
+        self._full_refreshed_at = 0.0
+        self._lock = threading.Lock()
+        self._refresh_thread: Optional[threading.Thread] = None
+
+    def get_spaces(self) -> List[Dict[str, Any]]:
+        """Return all known spaces, loading them on first use."""
+        self._ensure_loaded()
+        return list(self._spaces.values())
+
+    def best_match(self, dao_name: str) -> Optional[Tuple[float, str, str]]:
+        """Return the best (similarity, space id, space name) for `dao_name` from the name index."""
+        self._ensure_loaded()
+        return self._index.best_match(dao_name)
+
+    def _ensure_loaded(self) -> None:
+        if not self._spaces:
+            with self._lock:
+                if not self._spaces:
+                    self._load()
+        elif self.is_stale():
+            self.refresh_in_background()
+
+    def is_stale(self) -> bool:
+        return time.time() - self._refreshed_at > self.ttl
+
+    def refresh_in_background(self) -> None:
+        """Start a background refresh unless one is already running."""
+        with self._lock:
+            if self._refresh_thread is not None and self._refresh_thread.is_alive():
+                return
+            self._refresh_thread = threading.Thread(target=self._background_refresh, daemon=True)
+            self._refresh_thread.start()
+
+    def refresh(self, full: bool = False) -> None:
+        """Fetch spaces created since the last refresh, or re-crawl everything if `full`."""
+        now = time.time()
+        if full or not self._spaces or now - self._full_refreshed_at > self.full_refresh:
+            spaces = {space["id"]: space for space in fetch_spaces() if space.get("id")}
+            self._full_refreshed_at = now
+        else:
+            spaces = dict(self._spaces)
+            for space in fetch_spaces(created_gt=self._newest_created()):
+                if space.get("id"):
+                    spaces[space["id"]] = space
+
+        self._set_spaces(spaces)
+        self._refreshed_at = now
+        self._save()
+
+    def _set_spaces(self, spaces: Dict[str, Dict[str, Any]]) -> None:
+        # Swap in new objects so readers never see a partially updated directory
+        self._index = SpaceNameIndex(list(spaces.values()))
+        self._spaces = spaces
+
+    def _background_refresh(self) -> None:
+        try:
+            self.refresh()
+        except Exception:
+            # Keep serving the current copy; the next stale lookup will retry
+            pass
+
+    def _newest_created(self) -> int:
+        return max((space.get("created") or 0 for space in self._spaces.values()), default=0)
+
+    def _load(self) -> None:
+        if self.path and os.path.exists(self.path):
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    stored = json.load(f)
+                self._set_spaces({space["id"]: space for space in stored["spaces"] if space.get("id")})
+                self._refreshed_at = stored["refreshed_at"]
+                self._full_refreshed_at = stored["full_refreshed_at"]
+            except (OSError, ValueError, KeyError, TypeError):
+                self._spaces = {}
+
+        if not self._spaces:
+            self.refresh(full=True)
+        elif self.is_stale():
+            self._refresh_thread = threading.Thread(target=self._background_refresh, daemon=True)
+            self._refresh_thread.start()
+
+    def _save(self) -> None:
+        if not self.path:
+            return
+
+        stored = {
+            "refreshed_at": self._refreshed_at,
+            "full_refreshed_at": self._full_refreshed_at,
+            "spaces": list(self._spaces.values())
+        }
+        tmp_path = f"{self.path}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(stored, f)
+            os.replace(tmp_path, self.path)
+        except OSError:
+            pass
+
+
+snapshot_client = SnapshotClient()
+space_directory = SpaceDirectory()
+proposal_store = ProposalStore()
+proposal_flights = SingleFlight()
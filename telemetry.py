@@ -0,0 +1,242 @@
+"""
+Per-request instrumentation.
+
+A trace is started for each chat request and every instrumented stage runs
+in a span of it, recording its wall time and counters such as HTTP bytes,
+spaces and proposals fetched and OpenAI prompt and completion tokens. The
+current span is held in a context variable, so code that hands work to
+other threads wraps it with `in_current_context` to keep recording into
+the same trace. Without a current trace, spans and counters are no-ops.
+
+Finished traces can be exported as one JSON log record per request
+(TELEMETRY_LOG) and as OpenTelemetry-style span records appended to a JSON
+Lines file (TELEMETRY_SPANS_PATH).
+
+`startup_timings` keeps how long the app's imports took and how long it
+took to draw its first elements, on the process's first script run and on
+the latest rerun.
+"""
+import os
+import json
+import time
+import uuid
+import logging
+import functools
+import threading
+import contextvars
+from contextlib import contextmanager
+from typing import Dict, Any, Callable, List, Optional
+
+# Log a JSON summary of every finished request through the "deo.telemetry" logger
+TELEMETRY_LOG = os.environ.get("TELEMETRY_LOG", "").lower() in ("1", "true", "yes")
+# Optional JSON Lines file every finished request's spans are appended to
+TELEMETRY_SPANS_PATH = os.environ.get("TELEMETRY_SPANS_PATH")
+
+COUNTERS = ("http_requests", "http_bytes", "spaces", "proposals", "llm_requests", "prompt_tokens", "completion_tokens")
+
+logger = logging.getLogger("deo.telemetry")
+
+
+class Span:
+    """One timed operation of a trace and the counters recorded while it was current."""
+
+    def __init__(self, trace: "Trace", name: str, parent: Optional["Span"]):
+        self.trace = trace
+        self.name = name
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent.span_id if parent else None
+        self.depth = parent.depth + 1 if parent else 0
+        self.start_time = time.time()
+        self.duration: Optional[float] = None
+        self.counters: Dict[str, int] = {}
+        self.error: Optional[str] = None
+        self._started = time.perf_counter()
+
+    def add(self, **counters: int) -> None:
+        with self.trace.lock:
+            for name, value in counters.items():
+                self.counters[name] = self.counters.get(name, 0) + value
+
+    def end(self, error: Optional[BaseException] = None) -> None:
+        self.duration = time.perf_counter() - self._started
+        if error is not None:
+            self.error = f"{type(error).__name__}: {error}"
+
+
+class Trace:
+    """The spans recorded for one request."""
+
+    def __init__(self, name: str):
+        self.trace_id = uuid.uuid4().hex
+        self.lock = threading.Lock()
+        self.spans: List[Span] = []
+        self.root = self.new_span(name, None)
+
+    def new_span(self, name: str, parent: Optional[Span]) -> Span:
+        span = Span(self, name, parent)
+        with self.lock:
+            self.spans.append(span)
+        return span
+
+    def totals(self) -> Dict[str, int]:
+        with self.lock:
+            totals = {name: 0 for name in COUNTERS}
+            for span in self.spans:
+                for name, value in span.counters.items():
+                    totals[name] = totals.get(name, 0) + value
+        return totals
+
+    def rows(self) -> List[Dict[str, Any]]:
+        """One row per span for display, indented by nesting depth."""
+        with self.lock:
+            spans = list(self.spans)
+        return [
+            {
+                "stage": "  " * span.depth + span.name,
+                "ms": round(span.duration * 1000) if span.duration is not None else None,
+                **{name: span.counters.get(name, 0) for name in COUNTERS}
+            }
+            for span in spans
+        ]
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "trace_id": self.trace_id,
+            "name": self.root.name,
+            "duration_ms": round((self.root.duration or 0) * 1000, 1),
+            "error": self.root.error,
+            **self.totals(),
+            "spans": self.rows()
+        }
+
+    def otel_spans(self) -> List[Dict[str, Any]]:
+        """The trace's spans in the shape of OpenTelemetry span records."""
+        with self.lock:
+            spans = list(self.spans)
+        return [
+            {
+                "traceId": self.trace_id,
+                "spanId": span.span_id,
+                "parentSpanId": span.parent_id,
+                "name": span.name,
+                "startTimeUnixNano": int(span.start_time * 1e9),
+                "endTimeUnixNano": int((span.start_time + (span.duration or 0)) * 1e9),
+                "attributes": {f"deo.{name}": value for name, value in span.counters.items()},
+                "status": {"code": "ERROR", "message": span.error} if span.error else {"code": "OK"}
+            }
+            for span in spans
+        ]
+
+
+class StartupTimings:
+    """Import and first-paint times of the first and the latest script run of this process."""
+
+    def __init__(self):
+        self.runs = 0
+        self.first_run: Optional[Dict[str, float]] = None
+        self.last_run: Optional[Dict[str, float]] = None
+        self._lock = threading.Lock()
+
+    def record(self, imports: float, first_paint: float) -> None:
+        """Record a script run's seconds spent on imports and until its first elements were drawn."""
+        run = {"imports_ms": round(imports * 1000, 1), "first_paint_ms": round(first_paint * 1000, 1)}
+        with self._lock:
+            self.runs += 1
+            self.last_run = run
+            if self.first_run is None:
+                self.first_run = run
+                if TELEMETRY_LOG:
+                    logger.info(json.dumps({"name": "startup", **run}))
+
+
+_current_span: contextvars.ContextVar[Optional[Span]] = contextvars.ContextVar("deo_current_span", default=None)
+_export_lock = threading.Lock()
+
+
+@contextmanager
+def start_trace(name: str):
+    """Trace everything run in this block as one request, and export it when the block ends."""
+    trace = Trace(name)
+    token = _current_span.set(trace.root)
+    try:
+        yield trace
+    except BaseException as e:
+        trace.root.end(e)
+        raise
+    else:
+        trace.root.end()
+    finally:
+        _current_span.reset(token)
+        export(trace)
+
+
+@contextmanager
+def span(name: str):
+    """Run the block in a child span of the current span, if a trace is active."""
+    parent = _current_span.get()
+    if parent is None:
+        yield None
+        return
+
+    child = parent.trace.new_span(name, parent)
+    token = _current_span.set(child)
+    try:
+        yield child
+    except BaseException as e:
+        child.end(e)
+        raise
+    else:
+        child.end()
+    finally:
+        _current_span.reset(token)
+
+
+def traced(fn: Callable) -> Callable:
+    """Run every call of `fn` in a span named after it."""
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        with span(fn.__name__):
+            return fn(*args, **kwargs)
+    return wrapper
+
+
+def record(**counters: int) -> None:
+    """Add `counters` to the current span, if a trace is active."""
+    current = _current_span.get()
+    if current is not None:
+        current.add(**counters)
+
+
+def record_usage(usage: Any) -> None:
+    """Record an OpenAI response's `usage` token counts."""
+    if usage is not None:
+        record(
+            prompt_tokens=getattr(usage, "prompt_tokens", 0) or 0,
+            completion_tokens=getattr(usage, "completion_tokens", 0) or 0
+        )
+
+
+def in_current_context(fn: Callable) -> Callable:
+    """Wrap `fn` so that calls made on other threads record into the caller's current span."""
+    context = contextvars.copy_context()
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        # Each call gets its own copy: a context can only be entered by one thread at a time
+        return context.copy().run(fn, *args, **kwargs)
+    return wrapper
+
+
+def export(trace: Trace) -> None:
+    if TELEMETRY_LOG:
+        logger.info(json.dumps(trace.summary()))
+    if TELEMETRY_SPANS_PATH:
+        lines = "".join(json.dumps(span_record) + "\n" for span_record in trace.otel_spans())
+        try:
+            with _export_lock, open(TELEMETRY_SPANS_PATH, "a", encoding="utf-8") as f:
+                f.write(lines)
+        except OSError:
+            logger.warning("Could not write telemetry spans to %s", TELEMETRY_SPANS_PATH)
+
+
+startup_timings = StartupTimings()
@@ -0,0 +1,89 @@
+import time
+import threading
+
+import pytest
+
+import jobs
+from jobs import JobService, JobStore
+
+
+def fake_optimizer(tokens, delay=0.0):
+    """A stand-in for run_optimizer that streams `tokens`, `delay` seconds apart."""
+    def run(dao_name, initial_proposal, num_proposals, api_key, stream_writer=None):
+        for token in tokens:
+            time.sleep(delay)
+            stream_writer({"optimized_proposal_token": token})
+        return {"space_id": dao_name, "dao_analysis": "analysis", "optimized_proposal": "".join(tokens)}
+    return run
+
+
+@pytest.fixture
+def store(tmp_path):
+    return JobStore(str(tmp_path / "jobs.sqlite3"))
+
+
+def test_wait_forwards_tokens_of_a_local_run(store, monkeypatch):
+    monkeypatch.setattr(jobs, "run_optimizer", fake_optimizer(["a ", "b ", "c"], delay=0.05))
+    service = JobService(store, workers=1, default_api_key="sk-test").start()
+    try:
+        job_id = service.submit("aave.eth", "proposal", 5, "sk-test")
+        tokens = []
+        job = service.wait(job_id, tokens.append, poll_interval=0.2)
+    finally:
+        service.stop()
+
+    assert job["status"] == "done"
+    assert job["result"]["optimized_proposal"] == "a b c"
+    assert tokens == ["a ", "b ", "c"]
+
+
+def test_wait_returns_a_job_finished_elsewhere_while_other_jobs_stream(store, monkeypatch):
+    # Another local job notifies waiters every 20 ms for several seconds
+    monkeypatch.setattr(jobs, "run_optimizer", fake_optimizer(["token "] * 250, delay=0.02))
+    service = JobService(store, workers=1, default_api_key="sk-test").start()
+    try:
+        service.submit("aave.eth", "proposal", 5, "sk-test")
+        finished_id = store.create("ens.eth", "proposal", 5, uses_default_key=False)
+        with store._connect() as connection:
+            connection.execute("UPDATE jobs SET status = 'running', worker = 'elsewhere' WHERE id = ?", (finished_id,))
+        store.finish(finished_id, "elsewhere", error="DAO not found")
+
+        result = {}
+        waiter = threading.Thread(
+            target=lambda: result.update(job=service.wait(finished_id, poll_interval=0.2)), daemon=True
+        )
+        waiter.start()
+        waiter.join(timeout=2)
+    finally:
+        service.stop()
+
+    assert not waiter.is_alive()
+    assert result["job"]["status"] == "failed"
+    assert result["job"]["error"] == "DAO not found"
+
+
+def test_stale_claim_is_requeued_and_the_superseded_run_cannot_finish_it(store, monkeypatch):
+    job_id = store.create("aave.eth", "proposal", 5, uses_default_key=True)
+    assert store.claim("run-a", [])["id"] == job_id
+
+    monkeypatch.setattr(jobs, "JOB_STALE_AFTER", -1)
+    assert store.claim("run-b", [])["id"] == job_id
+
+    store.finish(job_id, "run-a", result={"optimized_proposal": "from a"})
+    assert store.get(job_id)["status"] == "running"
+
+    store.finish(job_id, "run-b", result={"optimized_proposal": "from b"})
+    job = store.get(job_id)
+    assert job["status"] == "done"
+    assert job["result"] == {"optimized_proposal": "from b"}
+
+
+def test_heartbeat_keeps_a_running_job_claimed(store, monkeypatch):
+    job_id = store.create("aave.eth", "proposal", 5, uses_default_key=True)
+    store.claim("run-a", [])
+    with store._connect() as connection:
+        connection.execute("UPDATE jobs SET heartbeat_at = 0 WHERE id = ?", (job_id,))
+
+    store.heartbeat(["run-a"])
+    assert store.claim("run-b", []) is None
+    assert store.get(job_id)["worker"] == "run-a"
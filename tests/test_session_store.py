@@ -0,0 +1,36 @@
+import time
+
+import pytest
+
+from session_store import FileSessionStore, SQLiteSessionStore
+
+
+@pytest.fixture(params=["sqlite", "files"])
+def store(request, tmp_path):
+    if request.param == "files":
+        return FileSessionStore(str(tmp_path / "sessions"))
+    return SQLiteSessionStore(str(tmp_path / "sessions.sqlite3"))
+
+
+def test_pending_job_is_kept_per_session_until_cleared(store):
+    assert store.pending_job("session-a") is None
+
+    store.set_pending_job("session-a", "job-1")
+    store.set_pending_job("session-b", "job-2")
+    store.set_pending_job("session-a", "job-3")
+    assert store.pending_job("session-a") == "job-3"
+    assert store.pending_job("session-b") == "job-2"
+
+    store.set_pending_job("session-a", None)
+    store.set_pending_job("session-a", None)
+    assert store.pending_job("session-a") is None
+    assert store.pending_job("session-b") == "job-2"
+
+
+def test_inactive_sessions_lose_their_messages_and_pending_job(store):
+    store.append("session-a", {"role": "user", "content": "hello"})
+    store.set_pending_job("session-a", "job-1")
+
+    store.delete_inactive_before(time.time() + 1)
+    assert store.recent("session-a", 10) == []
+    assert store.pending_job("session-a") is None
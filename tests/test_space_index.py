@@ -0,0 +1,26 @@
+from snapshot import SpaceNameIndex, calculate_similarity
+
+
+def linear_scan(spaces, dao_name):
+    return max((calculate_similarity(dao_name, space["name"], space["id"]), space["id"], space["name"])
+               for space in spaces)
+
+
+def test_short_name_contained_in_the_query_is_scored_despite_a_low_trigram_rank():
+    spaces = [
+        {"id": "raten14385.eth", "name": "Raten"},
+        {"id": "kograten.eth", "name": "Kograten DAO"},
+        {"id": "gratenba2199.eth", "name": "Gratenba"},
+    ]
+    index = SpaceNameIndex(spaces, shortlist=1)
+
+    assert index.best_match("graten") == linear_scan(spaces, "graten")
+    assert index.best_match("graten")[1] == "raten14385.eth"
+
+
+def test_names_containing_the_query_are_scored():
+    spaces = [{"id": f"space{i}.eth", "name": f"Zuloto{i}"} for i in range(20)]
+    spaces.append({"id": "maloto.eth", "name": "Maloto Labs"})
+    index = SpaceNameIndex(spaces, shortlist=1)
+
+    assert index.best_match("Loto Protocol") == linear_scan(spaces, "Loto Protocol")
@@ -0,0 +1,191 @@
+"""
+Warm-up of popular DAOs.
+
+A background worker started with the app prefetches the Snapshot space
+directory and, for the DAOs listed in WARMUP_DAOS and the WARMUP_TOP_N DAOs
+most often submitted to the job queue, their proposals, embeddings and
+analyses. It repeats this every WARMUP_INTERVAL seconds, so the first
+request of the day for a popular DAO takes the warm path.
+
+WARMUP_DAOS is a comma-separated list of DAO names, each optionally followed
+by the number of proposals to analyze (WARMUP_NUM_PROPOSALS otherwise):
+
+    WARMUP_DAOS="Aave, Uniswap:50, ENS"
+
+A DAO is warmed with the same Snapshot fetch and indexing a request for that
+number of proposals runs. The analysis itself is only prebuilt when all the
+fetched proposals are analyzed, which is always the case with the default
+RETRIEVAL_POOL_FACTOR=1; with retrieval on, which proposals get analyzed
+depends on the user's proposal.
+
+The analysis and embeddings use the default OPENAI_API_KEY; without it only
+the Snapshot data is warmed. A single warm-up pass can also be run on its
+own, for example from cron:
+
+    python warmup.py --once
+"""
+import os
+import sys
+import time
+import sqlite3
+import logging
+import argparse
+import threading
+from typing import Dict, List, Optional, Tuple
+from dotenv import load_dotenv
+
+# Load environment variables from .env file
+load_dotenv()
+
+from optimizer import get_space_id, prepare_space_data, analyze_dao_data, OptimizerError  # noqa: E402
+from snapshot import space_directory  # noqa: E402
+from jobs import JobStore, JOB_RETENTION  # noqa: E402
+from telemetry import start_trace  # noqa: E402
+
+# Seconds between warm-up passes; 0 disables the warm-up worker
+WARMUP_INTERVAL = int(os.environ.get("WARMUP_INTERVAL", 15 * 60))
+# DAOs always warmed: comma-separated names, each optionally followed by ":<num_proposals>"
+WARMUP_DAOS = os.environ.get("WARMUP_DAOS", "")
+# Proposals warmed for listed DAOs without their own number; the chat tool's default
+WARMUP_NUM_PROPOSALS = int(os.environ.get("WARMUP_NUM_PROPOSALS", 25))
+# Most often requested DAOs of the last WARMUP_WINDOW seconds that are warmed as well
+WARMUP_TOP_N = int(os.environ.get("WARMUP_TOP_N", 10))
+WARMUP_WINDOW = int(os.environ.get("WARMUP_WINDOW", JOB_RETENTION))
+
+logger = logging.getLogger("deo.warmup")
+
+
+def parse_dao_list(value: str) -> List[Tuple[str, int]]:
+    """(DAO name, number of proposals) pairs of a WARMUP_DAOS value."""
+    daos = []
+    for item in value.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        name, separator, number = item.rpartition(":")
+        if separator and number.strip().isdigit():
+            daos.append((name.strip(), int(number)))
+        else:
+            daos.append((item, WARMUP_NUM_PROPOSALS))
+    return daos
+
+
+class WarmupWorker:
+    """Keeps the space directory and the data and analyses of popular DAOs warm."""
+
+    def __init__(self, job_store: Optional[JobStore] = None, api_key: Optional[str] = None,
+                 daos: Optional[List[Tuple[str, int]]] = None, top_n: int = WARMUP_TOP_N,
+                 interval: int = WARMUP_INTERVAL):
+        self.job_store = job_store
+        self.api_key = api_key or os.environ.get("OPENAI_API_KEY")
+        self.daos = parse_dao_list(WARMUP_DAOS) if daos is None else daos
+        self.top_n = top_n
+        self.interval = interval
+        self.passes = 0
+        # Space id -> time it was last warmed
+        self.warmed: Dict[str, float] = {}
+        self._stopping = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> "WarmupWorker":
+        self._thread = threading.Thread(target=self._loop, name="deo-warmup", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stopping.set()
+
+    def _loop(self) -> None:
+        while not self._stopping.is_set():
+            self.run_once()
+            self._stopping.wait(self.interval)
+
+    def targets(self) -> List[Tuple[str, int]]:
+        """The listed DAOs followed by the most often requested ones."""
+        targets = list(self.daos)
+        if self.top_n > 0 and self.job_store is not None:
+            try:
+                targets += self.job_store.popular_daos(time.time() - WARMUP_WINDOW, self.top_n)
+            except sqlite3.Error as e:
+                logger.warning("Could not read popular DAOs from the job queue: %s", e)
+        return targets
+
+    def run_once(self) -> None:
+        """Warm the space directory and then every target DAO, once."""
+        try:
+            # Loads the directory on the first pass and starts a background refresh once it is stale
+            space_directory.get_spaces()
+        except Exception as e:
+            logger.warning("Could not load the Snapshot space directory: %s", e)
+            return
+
+        # Names resolving to the same space are warmed once, with the most proposals asked for
+        spaces: Dict[str, int] = {}
+        for dao_name, num_proposals in self.targets():
+            try:
+                space_id = get_space_id(dao_name)
+            except OptimizerError as e:
+                logger.warning("Not warming '%s': %s", dao_name, e)
+                continue
+            spaces[space_id] = max(num_proposals, spaces.get(space_id, 0))
+
+        for space_id, num_proposals in spaces.items():
+            if self._stopping.is_set():
+                return
+            try:
+                with start_trace("warmup"):
+                    self.warm(space_id, num_proposals)
+                self.warmed[space_id] = time.time()
+            except Exception as e:
+                logger.warning("Could not warm '%s': %s", space_id, e)
+        self.passes += 1
+
+    def warm(self, space_id: str, num_proposals: int) -> None:
+        dao_data = prepare_space_data(space_id, num_proposals, self.api_key)
+        # With more proposals than are analyzed, the analysis depends on the user's proposal
+        if self.api_key and len(dao_data["proposals"]) <= num_proposals:
+            analyze_dao_data(dao_data, self.api_key)
+
+
+_warmup_worker: Optional[WarmupWorker] = None
+_warmup_worker_lock = threading.Lock()
+
+
+def get_warmup_worker() -> Optional[WarmupWorker]:
+    """Return this process's warm-up worker, starting it on first use; None if WARMUP_INTERVAL is 0."""
+    global _warmup_worker
+    if WARMUP_INTERVAL <= 0:
+        return None
+    if _warmup_worker is None:
+        with _warmup_worker_lock:
+            if _warmup_worker is None:
+                _warmup_worker = WarmupWorker(JobStore()).start()
+    return _warmup_worker
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--once", action="store_true", help="run one warm-up pass and exit")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    worker = WarmupWorker(JobStore())
+    if args.once:
+        started = time.monotonic()
+        worker.run_once()
+        print(f"warmed {len(worker.warmed)} DAOs in {time.monotonic() - started:.1f}s", file=sys.stderr)
+        return
+
+    if worker.interval <= 0:
+        parser.error("WARMUP_INTERVAL must be positive unless --once is given")
+    worker.start()
+    print(f"warming {len(worker.targets())} DAOs every {worker.interval}s", file=sys.stderr)
+    try:
+        while True:
+            time.sleep(60)
+    except KeyboardInterrupt:
+        worker.stop()
+
+
+if __name__ == "__main__":
+    main()